@@ -0,0 +1,159 @@
+"""Offline stand-ins for the chat model, the embedder and Milvus.
+They sleep for a configurable latency, so the concurrency of the
+pipeline shows up in the numbers, and they count every call."""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from jarvis.helper.vector_db import make_chunk_ids
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.5
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages) -> ChatResult:
+        self.calls += 1
+        code = messages[-1].content
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()[:8]
+        content = (
+            f"name: Component{digest},\n"
+            "type: class,\n"
+            f"description: A synthetic component of {len(code)} characters,"
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._answer(messages)
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._answer(messages)
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dim: int = 1536, latency: float = 0.1):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        vectors = []
+        for text in texts:
+            # The same text always gets the same vector
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return self._embed(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeVectorDB:
+    """Keeps the rows in memory. Like VectorDB, one instance per collection,
+    and the collections live as long as the process."""
+
+    collections: Dict[str, Dict[int, Dict[str, Any]]] = {}
+    insert_calls = 0
+    delete_calls = 0
+
+    def __init__(self, collection_name: str = "project_files", dim: int = 1536, **kwargs):
+        self.collection_name = collection_name
+        self.dim = dim
+        self.created = collection_name not in self.collections
+        self.store_id = f"fake/{collection_name}"
+        self.rows = self.collections.setdefault(collection_name, {})
+
+    def insert(
+        self,
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        ids: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ) -> List[int]:
+        FakeVectorDB.insert_calls += 1
+        ids = ids or make_chunk_ids(file_paths)
+        for id, text, file_path in zip(ids, texts, file_paths):
+            self.rows[id] = {"text": text, "file_path": file_path}
+        return ids
+
+    def upsert(
+        self,
+        ids: List[int],
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ) -> List[int]:
+        return self.insert(texts, file_paths, vectors, start_lines, end_lines, ids, modified_ats)
+
+    def delete_by_paths(
+        self, file_paths: List[str], batch_size: int = 100, keep_ids: Optional[List[int]] = None
+    ) -> int:
+        FakeVectorDB.delete_calls += 1
+        paths = set(file_paths)
+        keep_ids = set(keep_ids or [])
+        deleted = [
+            id
+            for id, row in self.rows.items()
+            if row["file_path"] in paths and id not in keep_ids
+        ]
+        for id in deleted:
+            del self.rows[id]
+        return len(deleted)
+
+    def tune_index(self) -> bool:
+        return False
+
+    @classmethod
+    def reset(cls):
+        cls.collections.clear()
+        cls.insert_calls = 0
+        cls.delete_calls = 0
+
+
+class FakeDatabase:
+    """Remembers the project collections instead of writing them to Postgres"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection_by_path(self, path: str):
+        return self.collections.get(path)
+
+    def create_project_collection(self, name: str, path: str):
+        self.collections[path] = {"name": name, "path": path}
+        return self.collections[path]
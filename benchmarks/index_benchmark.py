@@ -0,0 +1,183 @@
+"""Measures the indexing pipeline (walk -> analyze -> chunk -> embed -> insert)
+on a synthetic project, with offline stand-ins for the LLM, the embedder and Milvus.
+
+    python -m benchmarks.index_benchmark --files 2000 --llm-latency 0.5
+
+Three runs are measured: a cold one (empty caches and manifest), one without
+changes and one after a share of the files changed."""
+
+import contextlib
+import shutil
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import asyncio
+import click
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, only the traced memory is reported there
+    resource = None
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def prepare_environment(work_dir: str, requests_per_second: float):
+    """Everything the controller reads from the environment, pointed at
+    throwaway locations. Has to happen before jarvis is imported."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'jarvis.db')}"
+    os.environ["JARVIS_CACHE_DIR"] = os.path.join(work_dir, "cache")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("EMBEDDING_MODEL", "text-embedding-3-small")
+    os.environ["CODING_MODEL_TYPE"] = "gpt"
+    os.environ["GPT_REQUESTS_PER_SECOND"] = str(requests_per_second)
+
+
+async def measure_run(name, controller, project, chat_model, embeddings, verbose):
+    from benchmarks.fakes import FakeVectorDB
+
+    chat_model.calls = 0
+    embeddings.calls = 0
+    embeddings.texts = 0
+    FakeVectorDB.insert_calls = 0
+    FakeVectorDB.delete_calls = 0
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+    output = sys.stdout if verbose else open(os.devnull, "w")
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        await controller.astart_indexing(project)
+    wall_time = time.perf_counter() - started
+    if not verbose:
+        output.close()
+
+    files = controller.changed_count + controller.skipped_count
+    result = {
+        "run": name,
+        "files": files,
+        "changed": controller.changed_count,
+        "static": controller.static_count,
+        "seconds": wall_time,
+        "files/s": files / wall_time if wall_time else 0.0,
+        "llm calls": chat_model.calls,
+        "embed calls": embeddings.calls,
+        "embedded texts": embeddings.texts,
+        "insert calls": FakeVectorDB.insert_calls,
+        "chunks/s": (
+            controller.inserted_count / controller.insert_seconds
+            if controller.insert_seconds
+            else None
+        ),
+        "rows": len(controller.vector_db.rows),
+        "peak rss MB": peak_rss_mb(),
+    }
+    if tracemalloc.is_tracing():
+        result["traced peak MB"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    return result
+
+
+def print_results(results):
+    columns = list(results[0].keys())
+    rows = [
+        [
+            f"{value:.2f}" if isinstance(value, float) else ("n/a" if value is None else str(value))
+            for value in (result.get(column) for column in columns)
+        ]
+        for result in results
+    ]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+async def run_benchmark(options, work_dir: str):
+    from benchmarks.fakes import FakeChatModel, FakeDatabase, FakeEmbeddings, FakeVectorDB
+    from benchmarks.synthetic_repo import generate_repo, touch_files
+    from jarvis.index_project.controller import IndexController
+
+    project = os.path.join(work_dir, "project")
+    started = time.perf_counter()
+    generate_repo(
+        project,
+        files=options["files"],
+        methods=options["methods"],
+        complex_ratio=options["complex_ratio"],
+    )
+    print(f"Generated {options['files']} files in {time.perf_counter() - started:.2f}s")
+
+    FakeVectorDB.reset()
+    controller = IndexController(
+        llm_analysis=options["llm_analysis"],
+        vector_db_class=FakeVectorDB,
+        db_service=FakeDatabase(),
+    )
+    chat_model = FakeChatModel(latency=options["llm_latency"])
+    embeddings = FakeEmbeddings(latency=options["embedding_latency"])
+    controller.index_code_agent.model = chat_model
+    controller.embedding_service.embeddings = embeddings
+
+    results = []
+    for name in ("cold", "unchanged", "touched"):
+        if name == "touched":
+            touched = touch_files(project, options["touch_ratio"])
+            print(f"Touched {touched} files")
+        results.append(
+            await measure_run(
+                name, controller, project, chat_model, embeddings, options["verbose"]
+            )
+        )
+    print_results(results)
+
+
+@click.command()
+@click.option("--files", default=1000, show_default=True, help="Files in the synthetic project")
+@click.option("--methods", default=8, show_default=True, help="Methods per class")
+@click.option(
+    "--complex-ratio",
+    default=0.1,
+    show_default=True,
+    help="Share of the files too big for the static analysis",
+)
+@click.option("--llm-latency", default=0.5, show_default=True, help="Seconds per LLM call")
+@click.option(
+    "--embedding-latency", default=0.1, show_default=True, help="Seconds per embedding call"
+)
+@click.option(
+    "--requests-per-second",
+    default=1000.0,
+    show_default=True,
+    help="Rate limit of the fake LLM",
+)
+@click.option("--touch-ratio", default=0.1, show_default=True, help="Share of files changed")
+@click.option("--llm-analysis", is_flag=True, help="Send every file to the LLM")
+@click.option("--trace-memory", is_flag=True, help="Also trace the Python allocations (slower)")
+@click.option("--keep", is_flag=True, help="Keep the generated project and caches")
+@click.option("--verbose", is_flag=True, help="Show the output of the indexing")
+def main(**options):
+    """Benchmark of the project indexing"""
+    work_dir = tempfile.mkdtemp(prefix="jarvis-benchmark-")
+    prepare_environment(work_dir, options["requests_per_second"])
+    if options["trace_memory"]:
+        tracemalloc.start()
+    try:
+        asyncio.run(run_benchmark(options, work_dir))
+    finally:
+        if options["keep"]:
+            print(f"Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Recall against latency and memory of the vector search, to check the index,
+the compression and the search parameters picked in
+jarvis/helper/vector_backends/tuning.py.
+
+    python -m benchmarks.recall_benchmark --rows 5000 --rows 50000
+    python -m benchmarks.recall_benchmark --compression none --compression fp16 --compression sq8
+    python -m benchmarks.recall_benchmark --backend milvus --index FLAT --index IVF_FLAT --index HNSW
+
+The vectors are clustered like embeddings of code are, the true neighbours
+come from an exact search with numpy."""
+
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import click
+import numpy as np
+from benchmarks.index_benchmark import print_results
+
+# What --index means for the local backend, which only knows exact and IVF
+LOCAL_INDEX_TYPES = {"auto": "auto", "FLAT": "exact", "IVF_FLAT": "ivf"}
+# What --compression means for the local backend, it has no PQ
+LOCAL_CODES = {"none": "float32", "fp16": "float16", "sq8": "int8"}
+
+
+def make_vectors(
+    rows: int, queries: int, dim: int, clusters: int, spread: float, seed: int = 0
+):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+
+    def sample(count):
+        points = centers[rng.integers(0, clusters, count)]
+        points = points + spread * rng.standard_normal((count, dim)).astype(np.float32)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(rows), sample(queries)
+
+
+def true_neighbours(vectors: np.ndarray, queries: np.ndarray, top_k: int) -> np.ndarray:
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    neighbours = []
+    for start in range(0, len(queries), 256):
+        distances = norms - 2 * (queries[start : start + 256] @ vectors.T)
+        best = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+        neighbours.append(best)
+    return np.concatenate(neighbours)
+
+
+def open_backend(backend: str, rows: int, dim: int):
+    from jarvis.helper.vector_db import VectorDB
+
+    vector_db = VectorDB(collection_name=f"recall_benchmark_{rows}", dim=dim, backend=backend)
+    if not vector_db.created:
+        vector_db.drop_collection()
+        vector_db = VectorDB(collection_name=f"recall_benchmark_{rows}", dim=dim, backend=backend)
+    return vector_db
+
+
+def use_index(vector_db, backend: str, index: str, compression: str, rows: int) -> str | None:
+    """Switches to the index, returns how to call it in the report,
+    or None when the index can't be compressed that way"""
+    if backend == "local":
+        vector_db.backend.index_type = LOCAL_INDEX_TYPES[index]
+        vector_db.backend.codes = LOCAL_CODES[compression]
+        vector_db.backend.state = None
+        return index if compression == "none" else f"{index}+{compression}"
+
+    from jarvis.helper.vector_backends.tuning import (
+        FLAT_MAX_ROWS,
+        HNSW_MIN_ROWS,
+        choose_index_params,
+        choose_nlist,
+    )
+
+    dim = vector_db.dim
+    if index == "auto":
+        params = choose_index_params(rows, dim, compression)
+    elif compression != "none":
+        if index != "IVF_FLAT":
+            return None
+        params = choose_index_params(max(rows, FLAT_MAX_ROWS), dim, compression)
+    elif index == "FLAT":
+        params = choose_index_params(0, dim)
+    elif index == "IVF_FLAT":
+        params = {"index_type": "IVF_FLAT", "metric_type": "L2", "params": {"nlist": choose_nlist(rows)}}
+    else:
+        params = choose_index_params(HNSW_MIN_ROWS, dim, "none")
+    vector_db.backend.rebuild_index(params)
+    return params["index_type"]
+
+
+def vector_bytes(vector_db, backend: str, rows: int) -> int:
+    """What the searched vectors take in memory"""
+    if backend == "local":
+        state = vector_db.backend.state
+        if state["codes"] is None:
+            return rows * vector_db.dim * 4
+        return state["codes"].nbytes + (state["scales"].nbytes if state["scales"] is not None else 0)
+    from jarvis.helper.vector_backends.tuning import estimate_index_bytes
+
+    return estimate_index_bytes(vector_db.backend.index_params, rows, vector_db.dim)
+
+
+def describe_search(vector_db, backend: str, top_k: int) -> str:
+    if backend == "local":
+        ivf = vector_db.backend.state and vector_db.backend.state["ivf"]
+        if not ivf:
+            return "exact"
+        nlist = len(ivf["centroids"])
+        nprobe = vector_db.backend._nprobe(nlist)
+        if 4 * nprobe >= nlist:
+            return f"nlist={nlist} exact"
+        return f"nlist={nlist} nprobe={nprobe}"
+    from jarvis.helper.vector_backends.tuning import choose_search_params
+
+    params = choose_search_params(
+        vector_db.backend.index_params, top_k, vector_db.backend.target_recall
+    )["params"]
+    index_params = vector_db.backend.index_params.get("params") or {}
+    return " ".join(f"{key}={value}" for key, value in {**index_params, **params}.items()) or "exact"
+
+
+def measure(vector_db, backend, queries, truth, ids, top_k, target_recall):
+    vector_db.backend.target_recall = target_recall
+    found = []
+    started = time.perf_counter()
+    for query in queries:
+        found.append(vector_db.search(query.tolist(), top_k))
+    seconds = time.perf_counter() - started
+
+    positions = {id: position for position, id in enumerate(ids)}
+    hits = sum(
+        len({positions[result["id"]] for result in results} & set(expected.tolist()))
+        for results, expected in zip(found, truth)
+    )
+    return {
+        "recall": hits / (len(queries) * top_k),
+        "ms/query": seconds * 1000 / len(queries),
+        "search": describe_search(vector_db, backend, top_k),
+    }
+
+
+def run_benchmark(options):
+    results = []
+    for rows in options["rows"]:
+        vectors, queries = make_vectors(
+            rows, options["queries"], options["dim"], options["clusters"], options["spread"]
+        )
+        truth = true_neighbours(vectors, queries, options["top_k"])
+
+        vector_db = open_backend(options["backend"], rows, options["dim"])
+        started = time.perf_counter()
+        ids = []
+        for start in range(0, rows, 5000):
+            batch = vectors[start : start + 5000]
+            ids += vector_db.insert(
+                [""] * len(batch),
+                [f"file{(start + i) // 10}.cs" for i in range(len(batch))],
+                batch.tolist(),
+            )
+        print(f"Inserted {rows} vectors in {time.perf_counter() - started:.2f}s")
+
+        try:
+            for index, compression in itertools.product(
+                options["index"], options["compression"]
+            ):
+                started = time.perf_counter()
+                name = use_index(vector_db, options["backend"], index, compression, rows)
+                if name is None:
+                    print(f"Skipped {index} with {compression}, only IVF is compressed")
+                    continue
+                # The first search loads the collection and trains the local IVF
+                vector_db.search(queries[0].tolist(), options["top_k"])
+                build_seconds = time.perf_counter() - started
+                megabytes = vector_bytes(vector_db, options["backend"], rows) / 1024 / 1024
+                for target_recall in options["target_recall"]:
+                    result = {
+                        "rows": rows,
+                        "index": name,
+                        "target": target_recall,
+                        "build s": build_seconds,
+                        "vector MB": megabytes,
+                        "saved": 1 - megabytes * 1024 * 1024 / (rows * options["dim"] * 4),
+                    }
+                    result.update(
+                        measure(
+                            vector_db,
+                            options["backend"],
+                            queries,
+                            truth,
+                            ids,
+                            options["top_k"],
+                            target_recall,
+                        )
+                    )
+                    results.append(result)
+        finally:
+            vector_db.drop_collection()
+    print_results(results)
+
+
+@click.command()
+@click.option("--backend", type=click.Choice(["local", "milvus"]), default="local", show_default=True)
+@click.option("--rows", multiple=True, type=int, default=[5000, 50000], show_default=True)
+@click.option(
+    "--index",
+    multiple=True,
+    type=click.Choice(["auto", "FLAT", "IVF_FLAT", "HNSW"]),
+    default=["auto"],
+    show_default=True,
+    help="auto is what the tuning picks for the row count, HNSW is Milvus only",
+)
+@click.option(
+    "--compression",
+    multiple=True,
+    type=click.Choice(["none", "fp16", "sq8", "pq"]),
+    default=["none"],
+    show_default=True,
+    help="fp16 is local only, pq Milvus only",
+)
+@click.option(
+    "--target-recall",
+    multiple=True,
+    type=float,
+    default=[0.8, 0.9, 0.95, 0.99],
+    show_default=True,
+)
+@click.option("--dim", default=256, show_default=True)
+@click.option("--clusters", default=200, show_default=True, help="Clusters in the synthetic vectors")
+@click.option(
+    "--spread",
+    default=2.0,
+    show_default=True,
+    help="Noise around the cluster centers, higher is harder for the indexes",
+)
+@click.option("--queries", default=200, show_default=True)
+@click.option("--top-k", default=10, show_default=True)
+def main(**options):
+    """Benchmark of the vector search recall"""
+    if options["backend"] == "local" and "HNSW" in options["index"]:
+        raise click.BadParameter("The local backend has no HNSW index", param_hint="--index")
+    if options["backend"] == "local" and "pq" in options["compression"]:
+        raise click.BadParameter("The local backend has no PQ codes", param_hint="--compression")
+    if options["backend"] == "milvus" and "fp16" in options["compression"]:
+        raise click.BadParameter("Milvus compresses with sq8 or pq", param_hint="--compression")
+    work_dir = tempfile.mkdtemp(prefix="jarvis-recall-")
+    os.environ["LOCAL_VECTOR_DIR"] = work_dir
+    try:
+        run_benchmark(options)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Generates a Unity-like project of any size to index"""
+
+import os
+import random
+
+JARVIS_YAML = """starting-directory: Assets
+
+ignored-directories:
+  - Prefabs
+
+included-file-extensions:
+  - .cs
+"""
+
+
+def make_class(name: str, methods: int, rng: random.Random) -> str:
+    lines = [
+        "using UnityEngine;",
+        "",
+        "namespace Synthetic",
+        "{",
+        "    /// <summary>",
+        f"    /// {name} is generated for the indexing benchmark.",
+        "    /// </summary>",
+        f"    public class {name} : MonoBehaviour",
+        "    {",
+        f"        [SerializeField] private float speed = {rng.randint(1, 10)}f;",
+        "        public int Health { get; private set; }",
+        "",
+    ]
+    for i in range(methods):
+        lines += [
+            f"        public void Method{i}(int amount)",
+            "        {",
+            f"            Health -= amount * {rng.randint(1, 100)};",
+            "            if (Health < 0)",
+            "            {",
+            f'                Debug.Log("{name}.Method{i} {{ done }}");',
+            "            }",
+            "        }",
+            "",
+        ]
+    lines += ["    }", "}", ""]
+    return "\n".join(lines)
+
+
+def generate_repo(
+    root: str,
+    files: int,
+    files_per_dir: int = 50,
+    methods: int = 8,
+    complex_ratio: float = 0.1,
+    seed: int = 0,
+) -> str:
+    """Writes the project into root and returns it. A complex_ratio of the files
+    get so many methods that the static analysis leaves them to the LLM."""
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, "Jarvis.yaml"), "w", encoding="utf-8") as file:
+        file.write(JARVIS_YAML)
+
+    for i in range(files):
+        directory = os.path.join(root, "Assets", "Scripts", f"Module{i // files_per_dir}")
+        os.makedirs(directory, exist_ok=True)
+        method_count = methods * 10 if rng.random() < complex_ratio else methods
+        with open(os.path.join(directory, f"Class{i}.cs"), "w", encoding="utf-8") as file:
+            file.write(make_class(f"Class{i}", method_count, rng))
+
+    # The walk must not even look in here
+    prefabs = os.path.join(root, "Assets", "Prefabs")
+    os.makedirs(prefabs, exist_ok=True)
+    for i in range(max(1, files // 10)):
+        with open(os.path.join(prefabs, f"Prefab{i}.cs"), "w", encoding="utf-8") as file:
+            file.write(make_class(f"Prefab{i}", 1, rng))
+    return root
+
+
+def touch_files(root: str, ratio: float, seed: int = 1) -> int:
+    """Changes the content of a share of the scripts, returns how many"""
+    rng = random.Random(seed)
+    touched = 0
+    for directory, _, names in os.walk(os.path.join(root, "Assets", "Scripts")):
+        for name in names:
+            if rng.random() < ratio:
+                with open(os.path.join(directory, name), "a", encoding="utf-8") as file:
+                    file.write(f"// touched {rng.random()}\n")
+                touched += 1
+    return touched
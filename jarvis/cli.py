@@ -3,11 +3,15 @@ import msvcrt
 import os
 import sys
 import asyncio
+from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 from jarvis.index_project.controller import IndexController
+from jarvis.index_project.watcher import ProjectWatcher
 from jarvis.main_controller import MainController
 from jarvis.project_template.controller import ProjectTempController
 from jarvis.codegen.controller import CodeGenController
+from jarvis.helper.db import SCHEMA_VERSION, ensure_schema
 
 
 def setup_python_path() -> None:
@@ -63,13 +67,25 @@ class CodeGenCLI:
         init_project: str,
         writecode: str,
         prompt: str,
+        watch: bool = False,
+        llm_analysis: bool = False,
+        filters: Optional[Dict[str, Any]] = None,
+        migrate: bool = False,
     ) -> int:
         if show_all:
             self.show_directory_info()
 
-        if index:
-            index_controller = IndexController()
-            index_controller.start_indexing(str(self.original_working_dir))
+        if migrate:
+            ensure_schema()
+            click.echo(f"The database schema is at version {SCHEMA_VERSION}.")
+
+        if watch:
+            # Indexes once, then keeps the index fresh until Ctrl+C
+            watcher = ProjectWatcher(IndexController(llm_analysis=llm_analysis))
+            await watcher.watch(str(self.original_working_dir))
+        elif index:
+            index_controller = IndexController(llm_analysis=llm_analysis)
+            await index_controller.astart_indexing(str(self.original_working_dir))
 
         if init_project:
             project_type = self.select_project_type()
@@ -80,7 +96,7 @@ class CodeGenCLI:
         if writecode:
             click.echo(f"Working directory: {self.original_working_dir}")
             await self.code_controller.manage_input(
-                writecode, self.original_working_dir
+                writecode, self.original_working_dir, filters
             )
 
         if prompt:
@@ -88,6 +104,23 @@ class CodeGenCLI:
 
         return 0
 
+    def make_filters(
+        self, path_prefix: str, extensions: Tuple[str, ...], modified_after: datetime
+    ) -> Optional[Dict[str, Any]]:
+        """The search filters of --writecode, paths relative to the working directory"""
+        filters = {}
+        if path_prefix:
+            path = os.path.abspath(os.path.join(self.original_working_dir, path_prefix))
+            # src shouldn't match src_old
+            if os.path.isdir(path):
+                path = os.path.join(path, "")
+            filters["path_prefix"] = path
+        if extensions:
+            filters["extensions"] = list(extensions)
+        if modified_after:
+            filters["modified_after"] = int(modified_after.timestamp())
+        return filters or None
+
 
 @click.command()
 @click.option(
@@ -104,15 +137,67 @@ class CodeGenCLI:
     help="Init a project in Jarvis DB to maintain chat history",
     is_flag=True,
 )
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running and re-index the changed files of the project",
+)
+@click.option(
+    "--llm-analysis",
+    is_flag=True,
+    help="Let the LLM analyze every file, not only the complex ones",
+)
 @click.option("--writecode", help="LLM prompt for code generation")
+@click.option(
+    "--path-prefix",
+    help="Only use code under this path for --writecode (relative to the working directory)",
+)
+@click.option(
+    "--ext",
+    multiple=True,
+    help="Only use files with this extension for --writecode, can be repeated",
+)
+@click.option(
+    "--modified-after",
+    type=click.DateTime(),
+    help="Only use files modified after this date for --writecode",
+)
 @click.option("-p", "--prompt", help="Basic LLM prompt")
-def main(all, index, init_project, writecode, prompt):
+@click.option(
+    "--migrate",
+    is_flag=True,
+    help="Bring the database schema up to date (needed with DB_AUTO_MIGRATE=false)",
+)
+def main(
+    all,
+    index,
+    watch,
+    llm_analysis,
+    init_project,
+    writecode,
+    path_prefix,
+    ext,
+    modified_after,
+    prompt,
+    migrate,
+):
     """Code generation and directory information utility"""
     try:
         setup_python_path()
         cli = CodeGenCLI()
+        filters = cli.make_filters(path_prefix, ext, modified_after)
         return asyncio.run(
-            cli.process_command(all, index, init_project, writecode, prompt)
+            cli.process_command(
+                all,
+                index,
+                init_project,
+                writecode,
+                prompt,
+                watch,
+                llm_analysis,
+                filters,
+                migrate,
+            )
         )
     except KeyboardInterrupt:
         click.echo("\nOperation cancelled by user")
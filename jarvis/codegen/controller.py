@@ -1,8 +1,10 @@
+import asyncio
 import json
 from pathlib import Path
 import pdb
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from jarvis.codegen.prompts import get_code_gen_agent_prompt
+from jarvis.codegen.retrieval import CodeRetriever
 from jarvis.codegen.service import (
     append_file,
     read_file,
@@ -11,16 +13,17 @@ from jarvis.codegen.service import (
     overwrite_lines,
 )
 from jarvis.codegen.types import ToolResult, ToolType
+from jarvis.helper.async_db import AsyncDatabase
 from jarvis.helper.base_controller import BaseController
+from jarvis.helper.chat_history import ChatHistory
 from jarvis.helper.cmd_prompt import run_command
-from jarvis.helper.db import Database, Role, Session
+from jarvis.helper.db import Session
 from jarvis.helper.embedding import EmbeddingService
 from jarvis.helper.models.coding_model import CodingModelSelector
 from langchain_core.tools import BaseTool
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import tool
-from langchain_core.messages import AIMessage, HumanMessage
 
 from jarvis.helper.vector_db import VectorDB
 
@@ -87,7 +90,10 @@ class CodeGenController(BaseController):
         )
 
         self.embedding = EmbeddingService()
-        self.db = Database()
+        # manage_input is async, the history and the messages are read
+        # and written without blocking the retrieval meanwhile
+        self.db = AsyncDatabase()
+        self.history = ChatHistory(self.db, self.llm)
 
         # Create agent executor
         self.agent_executor = AgentExecutor(
@@ -97,32 +103,42 @@ class CodeGenController(BaseController):
             handle_parsing_errors=True,
         )
 
-    def get_file_indexes(self, input: str, path: str):
-        collection = self.db.get_collection_by_path(path=path)
-        vector_store = VectorDB(collection_name=collection.name)
-        embeddings = self.embedding.embed_query(input)
-        # TODO Clean this part of the code
-        return vector_store.search(embeddings)[0].get("text")
-
-    async def manage_input(self, input: str, path: Path) -> Dict[str, Any]:
+    def retrieve_chunks(
+        self, collection_name: str, input: str, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        vector_store = VectorDB(collection_name=collection_name)
+        retriever = CodeRetriever(self.embedding, vector_store)
+        return retriever.retrieve(input, filters)
+
+    async def aget_file_indexes(
+        self, input: str, path: str, filters: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """filters narrow the retrieval down, see VectorBackend"""
+        collection = await self.db.get_collection_by_path(path=path)
+        # The embedding and the vector search block, they get a thread
+        chunks = await asyncio.to_thread(
+            self.retrieve_chunks, collection.name, input, filters
+        )
+        return "\n\n".join(chunk["text"] for chunk in chunks)
+
+    async def aload_history(self, path: str) -> Tuple[Optional[Session], List]:
+        session = await self.db.find_session_by_path(path)
+        # Only the latest turns and a summary of the older ones,
+        # the prompt doesn't grow with the age of the project
+        messages = await self.history.aload(session.id) if session else []
+        return session, messages
+
+    async def manage_input(
+        self, input: str, path: Path, filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Process user input and execute appropriate tools"""
         path = str(path)
-        messages = self.db.get_messages_by_sessions_path(path)
-        indexed_files = self.get_file_indexes(input=input, path=path)
+        (session, formatted_messages), indexed_files = await asyncio.gather(
+            self.aload_history(path),
+            self.aget_file_indexes(input=input, path=path, filters=filters),
+        )
         print(indexed_files)
 
-        # Convert to LangChain message objects
-        formatted_messages = []
-        if messages is not None:
-            formatted_messages = [
-                (
-                    HumanMessage(content=msg.content)
-                    if msg.role == Role.HUMAN
-                    else AIMessage(content=msg.content)
-                )
-                for msg in messages
-            ]
-
         agent_input = input + f"\n\n The available files: {indexed_files}"
 
         try:
@@ -135,10 +151,13 @@ class CodeGenController(BaseController):
             )
 
             output: str = result["output"]
-            session = self.db.find_session_by_path(path)
 
-            self.db.add_message(session_id=session.id, content=input, role=Role.HUMAN)
-            self.db.add_message(session_id=session.id, content=output, role=Role.AI)
+            messages = await self.db.record_exchange(
+                input, output, session_id=session.id if session else None, path=path
+            )
+            # Ready for the next turn, the older turns are summarized now.
+            # A first prompt has its session only from here on.
+            await self.history.aupdate_summary(messages[0].session_id)
 
             return {
                 "success": True,
@@ -0,0 +1,145 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from jarvis.helper.embedding import EmbeddingService
+from jarvis.helper.tokens import count_tokens
+from jarvis.helper.vector_db import VectorDB
+
+load_dotenv()
+
+# Sentences end with a punctuation mark or a line break
+SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+class CodeRetriever:
+    """Finds the indexed chunks a prompt is about. Long prompts ask for several
+    things, so besides the whole prompt every sentence of it is a query of its
+    own. All the queries are embedded in one request and searched in one
+    round trip. Every query also goes to the lexical index, which finds the
+    identifiers a prompt names (PlayerController, OnTriggerEnter). The rankings
+    are merged with reciprocal rank fusion.
+
+    Out of the fused candidates maximal marginal relevance picks the chunks,
+    so that near-duplicates don't crowd out the rest, with at most a few per
+    file, until the token budget of the prompt is spent."""
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        vector_db: VectorDB,
+        top_k: Optional[int] = None,
+        max_sub_queries: Optional[int] = None,
+        lexical: Optional[bool] = None,
+    ):
+        self.embedding_service = embedding_service
+        self.vector_db = vector_db
+        self.top_k = top_k or int(os.getenv("RETRIEVAL_TOP_K", "5"))
+        self.max_sub_queries = (
+            max_sub_queries
+            if max_sub_queries is not None
+            else int(os.getenv("RETRIEVAL_MAX_SUB_QUERIES", "4"))
+        )
+        self.lexical = (
+            lexical
+            if lexical is not None
+            else os.getenv("RETRIEVAL_LEXICAL", "true").lower() in ("1", "true", "yes")
+        )
+        # How deep every ranking is read before the fusion
+        self.candidates = max(self.top_k, int(os.getenv("RETRIEVAL_CANDIDATES", "20")))
+        # The usual constant of the fusion, it damps the weight of the top ranks
+        self.rrf_k = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+        # 1 ranks by relevance only, lower values favour chunks unlike the ones picked
+        self.mmr_lambda = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+        self.max_per_file = int(os.getenv("RETRIEVAL_MAX_CHUNKS_PER_FILE", "2"))
+        self.token_budget = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "3000"))
+
+    def make_queries(self, prompt: str) -> List[str]:
+        """The prompt first, then its longer sentences"""
+        queries = [prompt.strip()]
+        for sentence in SENTENCE_END.split(prompt):
+            sentence = sentence.strip()
+            if len(queries) > self.max_sub_queries:
+                break
+            # "Thanks." or "Do it" alone find nothing useful
+            if len(sentence.split()) >= 3 and sentence not in queries:
+                queries.append(sentence)
+        return queries
+
+    def retrieve(
+        self, prompt: str, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        queries = self.make_queries(prompt)
+        vectors = self.embedding_service.embed_queries(queries)
+        rankings = self.vector_db.search_many(vectors, top_k=self.candidates, filters=filters)
+        if self.lexical:
+            rankings += self.vector_db.search_lexical(
+                queries, top_k=self.candidates, filters=filters
+            )
+        candidates = self.fuse(rankings)[: self.candidates]
+        return self.pack(self.diversify(candidates))
+
+    def fuse(self, rankings: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Reciprocal rank fusion: a chunk scores 1 / (rrf_k + rank) in every
+        ranking it is in. Distances and BM25 scores don't compare, ranks do."""
+        scores: Dict[Any, float] = {}
+        hits: Dict[Any, Dict[str, Any]] = {}
+        for ranking in rankings:
+            for rank, hit in enumerate(ranking, start=1):
+                scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (self.rrf_k + rank)
+                hits.setdefault(hit["id"], hit)
+        return [
+            {**hits[id], "rrf_score": score}
+            for id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+    def diversify(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Orders the candidates by maximal marginal relevance: the relevance
+        (the fused score) minus the similarity to the chunks picked before"""
+        if len(candidates) < 2 or self.mmr_lambda >= 1:
+            return candidates
+        vectors = self.vector_db.get_vectors([hit["id"] for hit in candidates])
+        matrix = np.zeros((len(candidates), self.vector_db.dim), dtype=np.float32)
+        for i, hit in enumerate(candidates):
+            if hit["id"] in vectors:
+                matrix[i] = vectors[hit["id"]]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1)
+        # Cosine similarity, a chunk without a vector is like no other
+        similarity = matrix @ matrix.T
+
+        relevance = np.array([hit["rrf_score"] for hit in candidates])
+        relevance /= relevance.max()
+        picked: List[int] = []
+        redundancy = np.zeros(len(candidates))
+        remaining = list(range(len(candidates)))
+        while remaining:
+            scores = [
+                self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy[i]
+                for i in remaining
+            ]
+            best = remaining.pop(int(np.argmax(scores)))
+            picked.append(best)
+            redundancy = np.maximum(redundancy, similarity[best])
+        return [candidates[i] for i in picked]
+
+    def pack(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The first top_k hits that fit the token budget, with at most
+        max_per_file chunks of every file"""
+        packed = []
+        per_file: Dict[str, int] = {}
+        tokens = 0
+        for hit in hits:
+            if len(packed) >= self.top_k:
+                break
+            if per_file.get(hit["file_path"], 0) >= self.max_per_file:
+                continue
+            hit_tokens = count_tokens(hit["text"])
+            # A smaller chunk further down may still fit
+            if tokens + hit_tokens > self.token_budget:
+                continue
+            packed.append(hit)
+            per_file[hit["file_path"]] = per_file.get(hit["file_path"], 0) + 1
+            tokens += hit_tokens
+        return packed
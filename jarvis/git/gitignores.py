@@ -69,7 +69,10 @@ crashlytics-build.properties
 
 # Temporary auto-generated Android Assets
 /[Aa]ssets/[Ss]treamingAssets/aa.meta
-/[Aa]ssets/[Ss]treamingAssets/aa/*"""
+/[Aa]ssets/[Ss]treamingAssets/aa/*
+
+# Jarvis index state
+/.jarvis/"""
 
 python_gitignore = """# Environment variables
 .env
@@ -115,4 +118,7 @@ htmlcov/
 local_settings.py
 
 # Logs
-*.log"""
\ No newline at end of file
+*.log
+
+# Jarvis index state
+/.jarvis/"""
\ No newline at end of file
@@ -0,0 +1,159 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from jarvis.helper.db import (
+    Message,
+    ProjectCollection,
+    Role,
+    Session,
+    SessionSummary,
+    ancestor_paths,
+    check_schema,
+    get_database_url,
+    make_exchange,
+    make_session,
+    make_summary,
+    normalize_path,
+    select_messages_between,
+    select_recent_messages,
+    select_session_by_path,
+)
+
+load_dotenv()
+
+# The async drivers of the sync ones in DATABASE_URL
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+# Like the sync engine, one per process and created on first use. The
+# connections of asyncpg belong to the event loop that opened them, the
+# CLI runs one loop per process.
+_lock = asyncio.Lock()
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_async_database_url():
+    url = make_url(get_database_url())
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def get_async_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        url = get_async_database_url()
+        options = {}
+        if url.get_backend_name() != "sqlite":
+            options = {
+                "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+                "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+                "pool_pre_ping": True,
+                "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+            }
+        _engine = create_async_engine(url, **options)
+    return _engine
+
+
+async def get_async_session_factory() -> async_sessionmaker:
+    """The shared async session factory, the first call checks the schema"""
+    global _session_factory
+    async with _lock:
+        if _session_factory is None:
+            engine = get_async_engine()
+            async with engine.begin() as connection:
+                await connection.run_sync(check_schema)
+            _session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        return _session_factory
+
+
+class AsyncDatabase:
+    """What the async controllers need of Database, without blocking the
+    event loop. The queries are the ones of Database."""
+
+    @asynccontextmanager
+    async def session(self):
+        factory = await get_async_session_factory()
+        async with factory() as db_session:
+            yield db_session
+
+    async def get_collection_by_path(self, path: str) -> Optional[ProjectCollection]:
+        async with self.session() as db_session:
+            return (
+                await db_session.scalars(
+                    select(ProjectCollection)
+                    .where(ProjectCollection.path == normalize_path(path))
+                    .limit(1)
+                )
+            ).first()
+
+    async def find_session_by_path(self, path_to_find: str) -> Optional[Session]:
+        if not ancestor_paths(path_to_find):
+            return None
+        async with self.session() as db_session:
+            return (await db_session.scalars(select_session_by_path(path_to_find))).first()
+
+    async def get_recent_messages(
+        self, session_id: int, limit: int, before_id: Optional[int] = None
+    ) -> List[Message]:
+        async with self.session() as db_session:
+            return list(
+                await db_session.scalars(
+                    select_recent_messages(session_id, limit, before_id)
+                )
+            )
+
+    async def get_messages_between(
+        self,
+        session_id: int,
+        after_id: Optional[int],
+        before_id: int,
+        limit: int,
+    ) -> List[Message]:
+        async with self.session() as db_session:
+            return list(
+                await db_session.scalars(
+                    select_messages_between(session_id, after_id, before_id, limit)
+                )
+            )
+
+    async def get_summary(self, session_id: int) -> Optional[SessionSummary]:
+        async with self.session() as db_session:
+            return await db_session.get(SessionSummary, session_id)
+
+    async def save_summary(self, session_id: int, content: str, last_message: Message):
+        async with self.session() as db_session:
+            await db_session.merge(make_summary(session_id, content, last_message))
+            await db_session.commit()
+
+    async def add_messages(
+        self, session_id: int, messages: List[Tuple[Role, str]]
+    ) -> List[Message]:
+        async with self.session() as db_session:
+            new_messages = [
+                Message(session_id=session_id, content=content, role=role)
+                for role, content in messages
+            ]
+            db_session.add_all(new_messages)
+            await db_session.commit()
+            return new_messages
+
+    async def record_exchange(
+        self,
+        human: str,
+        ai: str,
+        session_id: Optional[int] = None,
+        path: Optional[str] = None,
+    ) -> List[Message]:
+        """See Database.record_exchange"""
+        async with self.session() as db_session:
+            messages = make_exchange(human, ai, session_id)
+            if session_id is None:
+                db_session.add(make_session(path, messages))
+            else:
+                db_session.add_all(messages)
+            await db_session.commit()
+            return messages
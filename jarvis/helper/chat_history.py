@@ -0,0 +1,128 @@
+import os
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from jarvis.helper.async_db import AsyncDatabase
+from jarvis.helper.db import Message, Role, SessionSummary
+from jarvis.helper.tokens import count_tokens
+
+load_dotenv()
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a developer and a coding assistant.
+Extend the summary with the new messages. Keep the decisions, the files and names mentioned,
+and what is still open. Drop small talk. Answer with the summary only, at most {max_words} words.
+
+Summary so far:
+{summary}
+
+New messages:
+{messages}"""
+
+
+class ChatHistory:
+    """The part of a session's history that goes into a prompt: the latest
+    messages, at most max_messages of them and token_budget tokens in all,
+    after a summary of the older ones. The history is read page by page
+    from the newest message, so a long session costs no more than a new one.
+
+    The messages that drop out of the window are folded into the summary
+    once summary_batch of them piled up, one LLM call per batch."""
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        llm=None,
+        max_messages: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        summary_batch: Optional[int] = None,
+    ):
+        self.db = db
+        self.llm = llm
+        self.max_messages = max_messages or int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+        self.token_budget = token_budget or int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+        self.summary_batch = summary_batch or int(os.getenv("HISTORY_SUMMARY_BATCH", "6"))
+        self.summary_max_words = int(os.getenv("HISTORY_SUMMARY_MAX_WORDS", "300"))
+        # The most messages folded in one call, a first summary of a long
+        # session is built over several turns
+        self.max_fold = 50
+
+    async def aload_window(
+        self, session_id: int
+    ) -> Tuple[Optional[SessionSummary], List[Message]]:
+        """The summary and the latest messages that fit, oldest first"""
+        summary = await self.db.get_summary(session_id)
+        budget = self.token_budget - (count_tokens(summary.content) if summary else 0)
+
+        window: List[Message] = []
+        before_id = None
+        while len(window) < self.max_messages:
+            limit = self.max_messages - len(window)
+            page = await self.db.get_recent_messages(session_id, limit, before_id)
+            for message in page:
+                budget -= count_tokens(message.content)
+                if budget < 0:
+                    return summary, window[::-1]
+                window.append(message)
+            if len(page) < limit:
+                break
+            before_id = page[-1].id
+        return summary, window[::-1]
+
+    def to_messages(
+        self, summary: Optional[SessionSummary], window: List[Message]
+    ) -> List[BaseMessage]:
+        """The history as LangChain messages, the summary first"""
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(
+                SystemMessage(
+                    content=f"Summary of the earlier conversation:\n{summary.content}"
+                )
+            )
+        messages += [
+            (
+                HumanMessage(content=message.content)
+                if message.role == Role.HUMAN
+                else AIMessage(content=message.content)
+            )
+            for message in window
+        ]
+        return messages
+
+    async def aload(self, session_id: int) -> List[BaseMessage]:
+        return self.to_messages(*await self.aload_window(session_id))
+
+    async def aupdate_summary(self, session_id: int) -> bool:
+        """Folds the messages before the window into the summary, once
+        enough of them are left out. Returns whether it did."""
+        if self.llm is None:
+            return False
+        summary, window = await self.aload_window(session_id)
+        if not window:
+            return False
+        dropped = await self.db.get_messages_between(
+            session_id,
+            summary.last_message_id if summary else None,
+            window[0].id,
+            self.max_fold,
+        )
+        if len(dropped) < self.summary_batch:
+            return False
+
+        transcript = "\n".join(
+            f"{message.role.value}: {message.content}" for message in dropped
+        )
+        try:
+            response = await self.llm.ainvoke(
+                SUMMARY_PROMPT.format(
+                    max_words=self.summary_max_words,
+                    summary=summary.content if summary else "(empty)",
+                    messages=transcript,
+                )
+            )
+        except Exception as e:
+            # The messages stay unsummarized, the next turn tries again
+            print(f"Error summarizing the history: {str(e)}")
+            return False
+        await self.db.save_summary(session_id, response.content, dropped[-1])
+        return True
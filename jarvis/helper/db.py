@@ -6,14 +6,20 @@ from sqlalchemy import (
     String,
     ForeignKey,
     DateTime,
+    Index,
     MetaData,
+    Table,
     desc,
+    inspect,
+    select,
 )
+from sqlalchemy.engine import Connection, Engine, make_url
 from sqlalchemy.orm import relationship, declarative_base, Session as SQLAlchemySession
 from sqlalchemy.sql import func
 from datetime import datetime
-from typing import Optional, List
+from typing import Callable, Optional, List, Tuple
 import os
+import threading
 from dotenv import load_dotenv
 from sqlalchemy.orm import relationship, sessionmaker, scoped_session, DeclarativeBase
 from enum import Enum
@@ -29,10 +35,6 @@ class Role(str, Enum):
     HUMAN = "Human"
 
 
-# Create SQLAlchemy engine and base
-engine = create_engine(os.getenv("DATABASE_URL"))
-
-
 class Base(DeclarativeBase):
     pass
 
@@ -59,6 +61,9 @@ class Session(Base):
     collection = Column(String, nullable=False)
     # project_type = Column(String, nullable=True)
 
+    # find_session_by_path looks up the latest session of some paths
+    __table_args__ = (Index("ix_sessions_path_created_at", "path", "created_at"),)
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -73,35 +78,258 @@ class Message(Base):
 
     session = relationship("Session", back_populates="messages")
 
+    # The history of a session is read in order, and paged by id
+    __table_args__ = (
+        Index("ix_messages_session_id_created_at", "session_id", "created_at"),
+        Index("ix_messages_session_id_id", "session_id", "id"),
+    )
 
-# Create all tables
-Base.metadata.create_all(engine)
 
+class SessionSummary(Base):
+    """A rolling summary of the messages of a session that no longer fit
+    into the prompt, extended as more of them drop out"""
 
-class Database:
-    def __init__(self):
-        """Initialize database connection using environment variables"""
-        DB_USER = os.getenv("DB_USER", "postgres")
-        DB_PASSWORD = os.getenv("DB_PASSWORD", "8556")
-        DB_HOST = os.getenv("DB_HOST", "localhost")
-        DB_PORT = os.getenv("DB_PORT", "5432")
-        DB_NAME = os.getenv("DB_NAME", "jarvis")
-
-        # Create connection URL
-        DATABASE_URL = (
-            f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    __tablename__ = "session_summaries"
+
+    session_id = Column(Integer, ForeignKey("sessions.id"), primary_key=True)
+    content = Column(String, nullable=False)
+    # The last message the summary covers
+    last_created_at = Column(DateTime(timezone=True), nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+# The version of the schema this code expects, kept in the schema_version
+# table. MIGRATIONS[i] brings a database from version i to i + 1, and only
+# the missing ones run.
+schema_version = Table(
+    "schema_version", Base.metadata, Column("version", Integer, nullable=False)
+)
+
+
+def normalize_path(path: str) -> str:
+    return path.replace("\\", "/")
+
+
+def ancestor_paths(path_to_find: str) -> List[str]:
+    """The path and the directories above it, without the root"""
+    path_obj = Path(path_to_find)
+    return [
+        normalize_path(str(path))
+        for path in [path_obj, *path_obj.parents]
+        if path != path.parent
+    ]
+
+
+# The queries both Database and AsyncDatabase run
+
+def select_session_by_path(path_to_find: str):
+    """The latest session of the path or of the closest directory above it,
+    the longest path is the deepest one"""
+    return (
+        select(Session)
+        .where(Session.path.in_(ancestor_paths(path_to_find)))
+        .order_by(
+            func.length(Session.path).desc(),
+            Session.created_at.desc(),
+            Session.id.desc(),
         )
+        .limit(1)
+    )
 
-        # Create engine
-        self.engine = create_engine(DATABASE_URL)
 
-        # Create all tables
-        Base.metadata.create_all(self.engine)
+# The history is paged by message id, the ids grow with every insert.
+# created_at can't do it: the messages of one commit share it, and SQLite
+# stores the server default without the fractions of a second a bound
+# datetime has, so the two never compare right.
+def select_recent_messages(session_id: int, limit: int, before_id: Optional[int] = None):
+    query = select(Message).where(Message.session_id == session_id)
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+    return query.order_by(Message.id.desc()).limit(limit)
+
+
+def select_messages_between(
+    session_id: int, after_id: Optional[int], before_id: int, limit: int
+):
+    query = select(Message).where(Message.session_id == session_id, Message.id < before_id)
+    if after_id is not None:
+        query = query.where(Message.id > after_id)
+    return query.order_by(Message.id).limit(limit)
+
+
+def make_summary(session_id: int, content: str, last_message: Message) -> SessionSummary:
+    return SessionSummary(
+        session_id=session_id,
+        content=content,
+        last_created_at=last_message.created_at,
+        last_message_id=last_message.id,
+    )
+
+
+def make_session(path: str, messages: Optional[List[Message]] = None) -> Session:
+    """A new session of the path. Its collection is the one indexed for the
+    path, or else the name of the directory, like the indexer names it."""
+    path = normalize_path(path)
+    indexed_collection = (
+        select(ProjectCollection.name)
+        .where(ProjectCollection.path == path)
+        .order_by(ProjectCollection.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return Session(
+        path=path,
+        collection=func.coalesce(indexed_collection, Path(path).name.replace(" ", "_")),
+        messages=messages or [],
+    )
 
-        # Create session factory
-        self.SessionLocal = sessionmaker(bind=self.engine)
-        scoped_session(self.SessionLocal)
-        self.Session = Session()
+
+def make_exchange(human: str, ai: str, session_id: Optional[int] = None) -> List[Message]:
+    return [
+        Message(session_id=session_id, content=human, role=Role.HUMAN),
+        Message(session_id=session_id, content=ai, role=Role.AI),
+    ]
+
+
+def _create_tables(connection: Connection):
+    # Databases from before the versioning have some of the tables already
+    Base.metadata.create_all(connection, checkfirst=True)
+
+
+def _create_lookup_indexes(connection: Connection):
+    # New databases got them from _create_tables already
+    for table in (Session.__table__, Message.__table__):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _create_summaries(connection: Connection):
+    SessionSummary.__table__.create(connection, checkfirst=True)
+
+
+def _create_message_id_index(connection: Connection):
+    for index in Message.__table__.indexes:
+        if index.name == "ix_messages_session_id_id":
+            index.create(connection, checkfirst=True)
+
+
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    _create_tables,
+    _create_lookup_indexes,
+    _create_summaries,
+    _create_message_id_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# One engine and one session factory per process, created on first use.
+# Every Database shares them, so the controllers share one connection pool.
+_lock = threading.RLock()
+_engine: Optional[Engine] = None
+_session_factory: Optional[sessionmaker] = None
+
+
+def get_database_url() -> str:
+    """DATABASE_URL, or the Postgres URL made of the DB_* variables"""
+    if os.getenv("DATABASE_URL"):
+        return os.getenv("DATABASE_URL")
+    DB_USER = os.getenv("DB_USER", "postgres")
+    DB_PASSWORD = os.getenv("DB_PASSWORD", "8556")
+    DB_HOST = os.getenv("DB_HOST", "localhost")
+    DB_PORT = os.getenv("DB_PORT", "5432")
+    DB_NAME = os.getenv("DB_NAME", "jarvis")
+    return f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def get_engine() -> Engine:
+    global _engine
+    with _lock:
+        if _engine is None:
+            url = make_url(get_database_url())
+            options = {}
+            if url.get_backend_name() != "sqlite":
+                options = {
+                    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+                    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+                    # Postgres or a proxy in between may have closed an idle
+                    # connection, the watch mode keeps the pool for hours
+                    "pool_pre_ping": True,
+                    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+                }
+            _engine = create_engine(url, **options)
+        return _engine
+
+
+def get_schema_version(connection: Connection) -> int:
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def migrate(connection: Connection) -> int:
+    """Runs the migrations the database is missing. Returns the version
+    the database was at."""
+    version = get_schema_version(connection)
+    if version >= SCHEMA_VERSION:
+        return version
+    print(f"Migrating the database schema from version {version} to {SCHEMA_VERSION}")
+    for migration in MIGRATIONS[version:]:
+        migration(connection)
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+    return version
+
+
+def ensure_schema(engine: Optional[Engine] = None) -> int:
+    """Migrates the database in one transaction, what `jarvis --migrate` runs"""
+    engine = engine or get_engine()
+    with engine.begin() as connection:
+        return migrate(connection)
+
+
+def check_schema(connection: Connection) -> int:
+    """Migrates the database on first use, unless DB_AUTO_MIGRATE is off.
+    Then an outdated schema is an error until `jarvis --migrate` ran."""
+    if os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes"):
+        return migrate(connection)
+    version = get_schema_version(connection)
+    if version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"The database schema is at version {version}, {SCHEMA_VERSION} is needed. "
+            "Run 'jarvis --migrate' first."
+        )
+    return version
+
+
+def get_session_factory() -> sessionmaker:
+    """The shared session factory. The first call checks the schema, so the
+    database is only touched once something is read or written."""
+    global _session_factory
+    with _lock:
+        if _session_factory is None:
+            engine = get_engine()
+            with engine.begin() as connection:
+                check_schema(connection)
+            # The objects stay readable after the commit without
+            # a SELECT to refresh them, the server defaults come back
+            # with the INSERT
+            _session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+        return _session_factory
+
+
+class Database:
+    """The chat history and the project collections. Cheap to create, all
+    instances share the engine and the session factory of the process."""
+
+    @property
+    def engine(self) -> Engine:
+        return get_engine()
+
+    @property
+    def SessionLocal(self) -> sessionmaker:
+        return get_session_factory()
 
     @property
     def session(self):
@@ -115,7 +343,6 @@ class Database:
             collection = ProjectCollection(name=name, path=path)
             db_session.add(collection)
             db_session.commit()
-            db_session.refresh(collection)
             return collection
         finally:
             db_session.close()
@@ -146,15 +373,11 @@ class Database:
 
     def create_session(self, path: str):
         """Create a new coding session"""
-        print("Creating new session...")
         db_session = self.SessionLocal()
-        parsed_path = self._replace_path_slashes(path)
-        print(f"The path parsed is {parsed_path}")
         try:
-            new_session = Session(path=parsed_path)
+            new_session = make_session(path)
             db_session.add(new_session)
             db_session.commit()
-            db_session.refresh(new_session)
             return new_session
         finally:
             db_session.close()
@@ -166,27 +389,21 @@ class Database:
         return messages
 
     def find_session_by_path(self, path_to_find: str) -> Session:
-        path_obj = Path(path_to_find)
-        while path_obj != path_obj.parent:
-            parsed_path = self._replace_path_slashes(str(path_obj))
-            db = self.session
-            try:
-                query = (
-                    db.query(Session)
-                    .filter(Session.path == parsed_path)
-                    .order_by(Session.created_at.desc())
-                )
-                result = query.first()
-                if result:
-                    return result
-                path_obj = path_obj.parent
-            finally:
-                db.close()
-        return None
+        """The latest session of the path or of the closest directory above it"""
+        if not ancestor_paths(path_to_find):
+            return None
+        db = self.session
+        try:
+            return db.scalars(select_session_by_path(path_to_find)).first()
+        finally:
+            db.close()
 
     def get_latest_session(self) -> Session:
-        session = self.session.query(Session).first()
-        return session
+        db_session = self.SessionLocal()
+        try:
+            return db_session.query(Session).first()
+        finally:
+            db_session.close()
 
     def get_session(self, session_id: int) -> Session:
         """Get a session by ID"""
@@ -198,16 +415,42 @@ class Database:
 
     def add_message(self, session_id: int, content: str, role: Role):
         """Add a message to a session"""
-        print("Start Start")
+        return self.add_messages(session_id, [(role, content)])[0]
+
+    def add_messages(
+        self, session_id: int, messages: List[Tuple[Role, str]]
+    ) -> List[Message]:
+        """Adds (role, content) messages to a session in one transaction,
+        the inserts go out as one batched statement"""
+        db_session = self.SessionLocal()
+        try:
+            new_messages = [
+                Message(session_id=session_id, content=content, role=role)
+                for role, content in messages
+            ]
+            db_session.add_all(new_messages)
+            db_session.commit()
+            return new_messages
+        finally:
+            db_session.close()
+
+    def record_exchange(
+        self,
+        human: str,
+        ai: str,
+        session_id: Optional[int] = None,
+        path: Optional[str] = None,
+    ) -> List[Message]:
+        """Stores a prompt and its answer. Without session_id a new session
+        of the path is created, in the same transaction as the messages."""
+        if session_id is not None:
+            return self.add_messages(session_id, [(Role.HUMAN, human), (Role.AI, ai)])
         db_session = self.SessionLocal()
-        print("End end")
         try:
-            new_message = Message(session_id=session_id, content=content, role=role)
-            print(f"The new message: {new_message}")
-            db_session.add(new_message)
+            messages = make_exchange(human, ai)
+            db_session.add(make_session(path, messages))
             db_session.commit()
-            db_session.refresh(new_message)
-            return new_message
+            return messages
         finally:
             db_session.close()
 
@@ -226,9 +469,7 @@ class Database:
 
     def get_latest_session_by_path(self, path: str):
         """Get the latest session for a specific path"""
-        print(f"The path {path}")
         parsed_path = self._replace_path_slashes(path)
-        # print(f"Parsed path: {parsed_path}")
         db_session = self.SessionLocal()
         try:
             return (
@@ -253,6 +494,4 @@ class Database:
             db_session.close()
 
     def _replace_path_slashes(self, path: str):
-        parsed_path = path.replace("\\", "/")
-        print(f"the parsed Parsed path: {parsed_path}")
-        return parsed_path
+        return path.replace("\\", "/")
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def get_cache_dir() -> str:
+    """The directory where Jarvis keeps its caches. JARVIS_CACHE_DIR wins,
+    otherwise the usual user cache directory of the platform is used."""
+    directory = os.getenv("JARVIS_CACHE_DIR")
+    if not directory:
+        if os.name == "nt":
+            base = os.getenv("LOCALAPPDATA", os.path.expanduser("~"))
+            directory = os.path.join(base, "jarvis", "cache")
+        else:
+            base = os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+            directory = os.path.join(base, "jarvis")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+class DiskCache:
+    """Content addressed key/value store in SQLite with a size cap.
+    Once the cap is reached, the least recently used entries are evicted."""
+
+    def __init__(self, name: str, max_bytes: int, directory: Optional[str] = None):
+        self.path = os.path.join(directory or get_cache_dir(), f"{name}.sqlite")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self.connection.commit()
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            # Keeps ("ab", "c") and ("a", "bc") apart
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self.lock:
+            # SQLite limits the number of variables of a single query
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self.connection.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        rows = [(key, value, len(value), now) for key, value in items]
+        if not rows:
+            return
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.commit()
+            self.total_bytes += sum(row[2] for row in rows)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drops the least recently used entries until the cache is
+        back under 90% of its cap, so it does not evict on every write."""
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+        target = self.max_bytes * 0.9
+        cursor = self.connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        )
+        evicted = []
+        for key, size in cursor:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.connection.commit()
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+    def close(self) -> None:
+        self.connection.close()
@@ -1,22 +1,155 @@
+from array import array
 from langchain_openai import OpenAIEmbeddings
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import asyncio
 import os
 from dotenv import load_dotenv
+from jarvis.helper.disk_cache import DiskCache
+from jarvis.helper.tokens import count_tokens
 
 load_dotenv()
 
 class EmbeddingService:
+   """Embeds texts in token aware batches. Identical texts are embedded once,
+   and every embedding is cached on disk by (model, text hash)."""
+
    def __init__(self):
        self.embeddings = OpenAIEmbeddings(model=os.getenv('EMBEDDING_MODEL'))
+       self.model_name = self.embeddings.model
+       self.batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '256'))
+       # OpenAI refuses requests above 300k tokens, stay well below
+       self.batch_tokens = int(os.getenv('EMBEDDING_BATCH_TOKENS', '100000'))
+       # Only matters when a call holds more than one batch (or several calls
+       # run at once). The indexer embeds INDEX_BATCH_SIZE chunks per call,
+       # which fit in a single request with the defaults.
+       self.semaphore = asyncio.Semaphore(int(os.getenv('EMBEDDING_CONCURRENCY', '4')))
+       self.cache = DiskCache(
+           'embeddings',
+           max_bytes=int(os.getenv('EMBEDDING_CACHE_MAX_MB', '512')) * 1024 * 1024,
+       )
+       # The embeddings which are being requested right now, by cache key
+       self.in_flight: Dict[str, asyncio.Future] = {}
 
-   def embed_chunks(self, chunks: List[Dict]) -> List[Dict]:
-       texts = [chunk['text'] for chunk in chunks]
-       embeddings = self.embeddings.embed_documents(texts)
+   async def aembed_chunks(self, chunks: List[Dict]) -> List[Dict]:
+       embeddings = await self.aembed_texts([chunk['text'] for chunk in chunks])
 
        for chunk, embedding in zip(chunks, embeddings):
            chunk['embedding'] = embedding
 
        return chunks
 
-   def embed_query(self, query: str) -> List[float]:
-       return self.embeddings.embed_query(query)
\ No newline at end of file
+   def embed_queries(self, queries: List[str]) -> List[List[float]]:
+       """Embeds all the queries of a search in a single request"""
+       keys = [self.get_cache_key(query, kind='query') for query in queries]
+       unique = dict(zip(keys, queries))
+       vectors = {
+           key: self._from_bytes(value)
+           for key, value in self.cache.get_many(unique).items()
+       }
+       missing = [(key, query) for key, query in unique.items() if key not in vectors]
+       if missing:
+           embeddings = self.embeddings.embed_documents([query for _, query in missing])
+           vectors.update(self._store(missing, embeddings))
+       return [vectors[key] for key in keys]
+
+   async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+       keys, vectors, missing = self._lookup(texts)
+
+       # Someone else is already embedding these, just wait for them
+       waiting = {key: self.in_flight[key] for key in missing if key in self.in_flight}
+       for key in waiting:
+           del missing[key]
+
+       loop = asyncio.get_running_loop()
+       futures = {key: loop.create_future() for key in missing}
+       self.in_flight.update(futures)
+       try:
+           await asyncio.gather(
+               *(
+                   self._aembed_batch(batch, futures)
+                   for batch in self.make_batches(list(missing.items()))
+               )
+           )
+       finally:
+           for key in futures:
+               self.in_flight.pop(key, None)
+
+       for key, future in futures.items():
+           vectors[key] = future.result()
+       for key, future in waiting.items():
+           vectors[key] = await future
+
+       return [vectors[key] for key in keys]
+
+   async def _aembed_batch(
+       self, batch: List[Tuple[str, str]], futures: Dict[str, asyncio.Future]
+   ):
+       try:
+           async with self.semaphore:
+               embeddings = await self.embeddings.aembed_documents(
+                   [text for _, text in batch]
+               )
+       except Exception as e:
+           for key, _ in batch:
+               futures[key].set_exception(e)
+               # Nobody might wait for it, which is fine
+               futures[key].exception()
+           raise
+
+       for key, embedding in self._store(batch, embeddings).items():
+           futures[key].set_result(embedding)
+
+   def make_batches(self, items: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+       """Cuts (key, text) pairs into batches that respect both the
+       number of texts and the number of tokens per request."""
+       batches = []
+       batch = []
+       batch_tokens = 0
+       for key, text in items:
+           tokens = count_tokens(text)
+           if batch and (
+               len(batch) >= self.batch_size or batch_tokens + tokens > self.batch_tokens
+           ):
+               batches.append(batch)
+               batch = []
+               batch_tokens = 0
+           batch.append((key, text))
+           batch_tokens += tokens
+       if batch:
+           batches.append(batch)
+       return batches
+
+   def get_cache_key(self, text: str, kind: str = 'document') -> str:
+       return DiskCache.make_key(self.model_name, kind, text)
+
+   def _lookup(self, texts: List[str]):
+       """Returns the cache key of every text, the cached vectors
+       and the unique texts that still have to be embedded."""
+       keys = [self.get_cache_key(text) for text in texts]
+       unique = dict(zip(keys, texts))
+       vectors = {
+           key: self._from_bytes(value)
+           for key, value in self.cache.get_many(unique).items()
+       }
+       missing = {key: text for key, text in unique.items() if key not in vectors}
+       return keys, vectors, missing
+
+   def _store(self, batch: List[Tuple[str, str]], embeddings: List[List[float]]):
+       vectors = {key: embedding for (key, _), embedding in zip(batch, embeddings)}
+       self.cache.set_many(
+           (key, self._to_bytes(embedding)) for key, embedding in vectors.items()
+       )
+       return vectors
+
+   @staticmethod
+   def _to_bytes(embedding: List[float]) -> bytes:
+       return array('f', embedding).tobytes()
+
+   @staticmethod
+   def _from_bytes(value: bytes) -> List[float]:
+       embedding = array('f')
+       embedding.frombytes(value)
+       return embedding.tolist()
+
+   def stats(self) -> str:
+       return self.cache.stats()
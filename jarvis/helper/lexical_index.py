@@ -0,0 +1,188 @@
+import os
+import re
+import secrets
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+from jarvis.helper.disk_cache import get_cache_dir
+from jarvis.helper.vector_backends.base import file_extension, make_sql_filter
+
+load_dotenv()
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+# PlayerController -> Player, Controller; HTTPServer -> HTTP, Server
+WORD_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def get_lexical_dir() -> str:
+    return os.getenv("LEXICAL_INDEX_DIR") or os.path.join(get_cache_dir(), "lexical")
+
+
+def split_terms(text: str) -> Iterator[str]:
+    """The identifiers of the text, lowercased, and the words they are made of.
+    OnTriggerEnter gives ontriggerenter, on, trigger and enter."""
+    for identifier in IDENTIFIER.findall(text):
+        yield identifier.lower()
+        parts = WORD_PART.findall(identifier)
+        if len(parts) > 1:
+            for part in parts:
+                yield part.lower()
+
+
+class LexicalIndex:
+    """A BM25 ranked inverted index (SQLite FTS5) over the chunk texts of a
+    collection. The vectors find what a prompt means, this finds the exact
+    identifiers it names, which a summary often doesn't mention.
+
+    Rows are keyed by the chunk ids of the vector collection, and the
+    filters are the same as for the vector search."""
+
+    # Prompts can be long, the rarest terms matter anyway
+    MAX_QUERY_TERMS = 64
+    # Tables of an older layout are rebuilt, the indexer fills them again
+    COLUMNS = {"id", "text", "file_path", "file_ext", "modified_at", "start_line", "end_line"}
+
+    def __init__(self, collection_name: str, directory: Optional[str] = None):
+        directory = directory or get_lexical_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{collection_name}.sqlite")
+        self.created = not os.path.exists(self.path)
+        # The indexer writes from a worker thread
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(chunks)")}
+        if columns and columns != self.COLUMNS:
+            self.connection.executescript(
+                "DROP TABLE chunks; DROP TABLE IF EXISTS terms; DROP TABLE IF EXISTS info;"
+            )
+            self.created = True
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                text TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_ext TEXT NOT NULL,
+                modified_at INTEGER NOT NULL,
+                start_line INTEGER NOT NULL,
+                end_line INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_file_path ON chunks (file_path);
+            CREATE INDEX IF NOT EXISTS chunks_file_ext ON chunks (file_ext);
+            -- The underscore belongs to the identifiers
+            CREATE VIRTUAL TABLE IF NOT EXISTS terms
+                USING fts5(words, tokenize="unicode61 tokenchars '_'");
+            """
+        )
+        # Tells this index apart from one that was lost and created again
+        row = self.connection.execute("SELECT value FROM info WHERE key = 'store_id'").fetchone()
+        if row is None:
+            row = (secrets.randbits(62),)
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO info (key, value) VALUES ('store_id', ?)", row
+                )
+        self.store_id = str(row[0])
+
+    def upsert(
+        self,
+        ids: List[int],
+        texts: List[str],
+        file_paths: List[str],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ):
+        start_lines = start_lines or [1] * len(texts)
+        end_lines = end_lines or [0] * len(texts)
+        modified_ats = modified_ats or [0] * len(texts)
+        rows = [
+            (id, text, file_path, file_extension(file_path), int(modified_at), start_line, end_line)
+            for id, text, file_path, modified_at, start_line, end_line in zip(
+                ids, texts, file_paths, modified_ats, start_lines, end_lines
+            )
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM terms WHERE rowid = ?", [(id,) for id in ids])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO chunks "
+                "(id, text, file_path, file_ext, modified_at, start_line, end_line) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.executemany(
+                "INSERT INTO terms (rowid, words) VALUES (?, ?)",
+                [(id, " ".join(split_terms(text))) for id, text in zip(ids, texts)],
+            )
+
+    def delete_by_paths(self, file_paths: List[str], keep_ids: Optional[List[int]] = None) -> int:
+        keep_ids = set(keep_ids or [])
+        with self.lock, self.connection:
+            ids = [
+                id
+                for file_path in file_paths
+                for (id,) in self.connection.execute(
+                    "SELECT id FROM chunks WHERE file_path = ?", (file_path,)
+                )
+                if id not in keep_ids
+            ]
+            self.connection.executemany("DELETE FROM terms WHERE rowid = ?", [(id,) for id in ids])
+            self.connection.executemany("DELETE FROM chunks WHERE id = ?", [(id,) for id in ids])
+        return len(ids)
+
+    def make_match(self, query: str) -> Optional[str]:
+        terms = list(dict.fromkeys(split_terms(query)))[: self.MAX_QUERY_TERMS]
+        if not terms:
+            return None
+        # The terms are plain words, quoting them keeps FTS5 from reading
+        # AND, OR or NEAR in a prompt as operators
+        return " OR ".join(f'"{term}"' for term in terms)
+
+    def search(
+        self, query: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """The best matching chunks, the score is BM25 (higher is better)"""
+        match = self.make_match(query)
+        if match is None:
+            return []
+        conditions, parameters = make_sql_filter(filters, "chunks")
+        where = ["terms MATCH ?", *conditions]
+        parameters = [match, *parameters]
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT chunks.id, bm25(terms), chunks.text, chunks.file_path, "
+                "chunks.start_line, chunks.end_line "
+                "FROM terms JOIN chunks ON chunks.id = terms.rowid "
+                f"WHERE {' AND '.join(where)} ORDER BY bm25(terms) LIMIT ?",
+                (*parameters, top_k),
+            ).fetchall()
+        return [
+            {
+                "id": id,
+                # FTS5 negates BM25 so that smaller sorts first
+                "score": -score,
+                "text": text,
+                "file_path": file_path,
+                "start_line": start_line,
+                "end_line": end_line,
+            }
+            for id, score, text, file_path, start_line, end_line in rows
+        ]
+
+    def search_many(
+        self, queries: List[str], top_k: int = 5, filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        return [self.search(query, top_k, filters) for query in queries]
+
+    def reset(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM chunks")
+            self.connection.execute("DELETE FROM terms")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its tables on first use, which fails offline
+        print(f"Token counting falls back to an estimate: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Counts the tokens of a text the way the OpenAI models do.
+    Without tiktoken it estimates four characters per token."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from jarvis.helper.vector_backends.tuning import get_target_recall
+
+
+def make_chunk_id(file_path: str, position: int) -> int:
+    """A stable id for the chunk at a position of a file. Indexing the file
+    again gives the same ids, so its rows are replaced instead of piling up."""
+    digest = hashlib.sha256(f"{file_path}\0{position}".encode("utf-8")).digest()
+    # A positive int64, which is what the Milvus primary key holds
+    return int.from_bytes(digest[:8], "big") >> 1
+
+
+def make_chunk_ids(file_paths: List[str]) -> List[int]:
+    """The ids of chunks given in file order, numbered per file"""
+    positions: Dict[str, int] = {}
+    ids = []
+    for file_path in file_paths:
+        position = positions.get(file_path, 0)
+        positions[file_path] = position + 1
+        ids.append(make_chunk_id(file_path, position))
+    return ids
+
+
+def file_extension(file_path: str) -> str:
+    """".cs" for "Player.cs", what the extensions filter compares with"""
+    return os.path.splitext(file_path)[1].lower()
+
+
+def normalize_extensions(extensions) -> List[str]:
+    return [
+        extension.lower() if extension.startswith(".") else f".{extension.lower()}"
+        for extension in extensions
+    ]
+
+
+def make_sql_filter(filters: Optional[Dict[str, Any]], table: str) -> Tuple[List[str], List[Any]]:
+    """The filters as SQL conditions on the file_path, file_ext and
+    modified_at columns of the table, with their parameters"""
+    conditions, parameters = [], []
+    if not filters:
+        return conditions, parameters
+    # The lists go in as JSON, SQLite limits the parameters of a statement
+    if filters.get("file_paths") is not None:
+        conditions.append(f"{table}.file_path IN (SELECT value FROM json_each(?))")
+        parameters.append(json.dumps(list(filters["file_paths"])))
+    if filters.get("path_prefix"):
+        conditions.append(f"substr({table}.file_path, 1, ?) = ?")
+        parameters += [len(filters["path_prefix"]), filters["path_prefix"]]
+    if filters.get("extensions"):
+        conditions.append(f"{table}.file_ext IN (SELECT value FROM json_each(?))")
+        parameters.append(json.dumps(normalize_extensions(filters["extensions"])))
+    if filters.get("modified_after") is not None:
+        conditions.append(f"{table}.modified_at > ?")
+        parameters.append(int(filters["modified_after"]))
+    return conditions, parameters
+
+
+class VectorBackend:
+    """What VectorDB needs from a vector store. Every backend holds one
+    collection; `created` tells whether the collection was just created,
+    so whoever indexes into it knows that everything has to be indexed again.
+    `store_id` is made when the collection is created, a collection that was
+    lost and created again (even by a search) has another one.
+
+    Rows are keyed by their chunk id (see make_chunk_id). Inserting an id
+    that exists already is undefined, upsert replaces it.
+
+    Besides the text, the path and the line range every row keeps the
+    extension of its file and when the file was modified (epoch seconds,
+    0 when unknown), so that searches can be narrowed down by them.
+
+    The search results are dicts with id, distance (squared L2, smaller is
+    closer), text, file_path, start_line and end_line.
+
+    The filters narrow a search down, all of them have to match:
+        file_paths: only these files
+        path_prefix: only the files under this path
+        extensions: only the files with these extensions (".cs" or "cs")
+        modified_after: only the files modified after this epoch second"""
+
+    def __init__(self, collection_name: str, dim: int):
+        self.collection_name = collection_name
+        self.dim = dim
+        self.created = False
+        self.store_id = ""
+        # Searches pick their parameters to find this share of the true neighbours
+        self.target_recall = get_target_recall()
+
+    def insert(
+        self,
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        ids: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ) -> List[int]:
+        """Without ids the chunks are numbered per file in the given order"""
+        raise NotImplementedError
+
+    def upsert(
+        self,
+        ids: List[int],
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ) -> List[int]:
+        """Inserts the chunks, replacing the rows with the same ids"""
+        raise NotImplementedError
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.search_many([query_vector], top_k, filters)[0]
+
+    def search_many(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Searches all the queries at once, the results are grouped per query"""
+        raise NotImplementedError
+
+    def get_vectors(self, ids: List[int]) -> Dict[int, List[float]]:
+        """The stored vectors of the chunks, ids that don't exist are left out"""
+        raise NotImplementedError
+
+    def delete_by_paths(
+        self,
+        file_paths: List[str],
+        batch_size: int = 100,
+        keep_ids: Optional[List[int]] = None,
+    ) -> int:
+        """Delete every vector that belongs to one of the given files,
+        except the rows with the keep_ids"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Backends that buffer the writes persist them here"""
+
+    def tune_index(self) -> bool:
+        """Rebuilds the index when the collection outgrew it (see tuning.py).
+        Backends that adapt on their own don't need to."""
+        return False
+
+    def drop_collection(self) -> bool:
+        raise NotImplementedError
@@ -0,0 +1,630 @@
+import glob
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from jarvis.helper.disk_cache import get_cache_dir
+from jarvis.helper.vector_backends.base import (
+    VectorBackend,
+    file_extension,
+    make_chunk_ids,
+    make_sql_filter,
+)
+from jarvis.helper.vector_backends.tuning import FLAT_MAX_ROWS, choose_nprobe, get_rerank_factor
+
+load_dotenv()
+
+
+def get_vector_dir() -> str:
+    """Where the local collections live. Losing them is no disaster, the
+    indexer notices a new collection and indexes the project again."""
+    return os.getenv("LOCAL_VECTOR_DIR") or os.path.join(get_cache_dir(), "vectors")
+
+
+def encode_vectors(block: np.ndarray, codes: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """The compressed vectors and, for int8, the scale of every vector"""
+    if codes == "float16":
+        return block.astype(np.float16), None
+    scales = np.abs(block).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(block / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class LocalBackend(VectorBackend):
+    """An embedded vector store, no services needed. The vectors sit in a
+    memory-mapped float32 file, the texts and paths in SQLite, the row id
+    being the position of the vector in the file (the chunk id is a column
+    of its own). Deleted and replaced rows are only marked, the file is
+    compacted once most of it is garbage.
+
+    Small collections are searched exactly. Above LOCAL_IVF_MIN_ROWS rows an
+    IVF index (k-means lists, only the nprobe nearest lists are scanned)
+    is trained in-process and stored next to the vectors. Unless
+    LOCAL_IVF_NPROBE is set, nprobe follows from the target recall.
+
+    With LOCAL_VECTOR_CODES=float16 or int8 the searches scan a compressed
+    copy of the vectors kept in memory (a half or a quarter of the size), and
+    only the best few hits are re-ranked on the float32 file."""
+
+    def __init__(
+        self,
+        collection_name: str = "project_files",
+        dim: int = 1536,
+        directory: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(collection_name, dim)
+        self.directory = os.path.join(directory or get_vector_dir(), collection_name)
+        self.index_type = os.getenv("LOCAL_INDEX_TYPE", "auto").lower()
+        self.ivf_min_rows = int(os.getenv("LOCAL_IVF_MIN_ROWS", str(FLAT_MAX_ROWS)))
+        nprobe = os.getenv("LOCAL_IVF_NPROBE")
+        self.nprobe = int(nprobe) if nprobe else None
+        self.codes = os.getenv("LOCAL_VECTOR_CODES", "float32").lower()
+        if self.codes not in ("float32", "float16", "int8"):
+            raise ValueError(
+                f"Invalid local vector codes: {self.codes}. Must be 'float32', 'float16' or 'int8'."
+            )
+        self.rerank_factor = get_rerank_factor()
+        # The indexer inserts from a worker thread
+        self.lock = threading.RLock()
+
+        database_path = os.path.join(self.directory, "meta.sqlite")
+        self.created = not os.path.exists(database_path)
+        os.makedirs(self.directory, exist_ok=True)
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS rows (
+                id INTEGER PRIMARY KEY,
+                chunk_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                file_ext TEXT NOT NULL DEFAULT '',
+                modified_at INTEGER NOT NULL DEFAULT 0,
+                start_line INTEGER NOT NULL,
+                end_line INTEGER NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS rows_file_path ON rows (file_path);
+            CREATE INDEX IF NOT EXISTS rows_chunk_id ON rows (chunk_id);
+            """
+        )
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(rows)")}
+        stored_dim = self._get_info("dim")
+        if stored_dim is None:
+            self._set_info("dim", dim)
+            self.connection.commit()
+        elif stored_dim != dim or not {"chunk_id", "file_ext", "modified_at"} <= columns:
+            # Another embedding model or a collection from before the chunk
+            # ids or the file metadata, the old rows are useless.
+            print(f"The collection {collection_name} is outdated, recreating it.")
+            self.drop_collection()
+            self.__init__(collection_name, dim, directory)
+            self.created = True
+            return
+
+        store_id = self._get_info("store_id")
+        if store_id is None:
+            store_id = secrets.randbits(62)
+            self._set_info("store_id", store_id)
+            self.connection.commit()
+        self.store_id = str(store_id)
+
+        # Opened lazily and refreshed whenever another process wrote
+        self.vectors: Optional[np.memmap] = None
+        self.state: Optional[Dict[str, Any]] = None
+        self._remove_stale_files()
+
+    def _get_info(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        row = self.connection.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_info(self, key: str, value: int):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _vectors_path(self, generation: Optional[int] = None) -> str:
+        # Every compaction writes a new file, so a crash never leaves
+        # the vectors and the rows out of step.
+        if generation is None:
+            generation = self._get_info("generation", 0)
+        return os.path.join(self.directory, f"vectors-{generation}.f32")
+
+    def _ivf_path(self) -> str:
+        return os.path.join(self.directory, f"ivf-{self._get_info('generation', 0)}.npz")
+
+    def _remove_stale_files(self):
+        current = {self._vectors_path(), self._ivf_path()}
+        for path in glob.glob(os.path.join(self.directory, "*-*.f32")) + glob.glob(
+            os.path.join(self.directory, "*-*.npz*")
+        ):
+            if path not in current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Still mapped by another process, the next run removes it
+                    pass
+
+    def _open_vectors(self, min_rows: int = 0):
+        """Maps the vector file, growing it to hold at least min_rows rows"""
+        path = self._vectors_path()
+        row_bytes = self.dim * 4
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        capacity = size // row_bytes
+        if min_rows > capacity:
+            # Grow by doubling, resizing a mapped file means remapping it
+            capacity = max(min_rows, capacity * 2, 1024)
+            self._close_vectors()
+            with open(path, "ab") as file:
+                file.truncate(capacity * row_bytes)
+        if (
+            self.vectors is None
+            or self.vectors.filename != os.path.abspath(path)
+            or self.vectors.shape[0] != capacity
+        ):
+            self._close_vectors()
+            if capacity:
+                self.vectors = np.memmap(
+                    path, dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+                )
+
+    def _close_vectors(self):
+        # The mapping is closed once the last view of it is gone,
+        # and the search state holds views of it.
+        self.state = None
+        self.vectors = None
+
+    def insert(
+        self,
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        ids: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ) -> List[int]:
+        if not texts:
+            return []
+        ids = ids or make_chunk_ids(file_paths)
+        # Without line ranges a chunk covers the whole file (end_line 0)
+        start_lines = start_lines or [1] * len(texts)
+        end_lines = end_lines or [0] * len(texts)
+        modified_ats = modified_ats or [0] * len(texts)
+        with self.lock:
+            count = self._get_info("count", 0)
+            positions = range(count, count + len(texts))
+            self._open_vectors(min_rows=count + len(texts))
+            self.vectors[count : count + len(texts)] = np.asarray(vectors, dtype=np.float32)
+            self.vectors.flush()
+
+            self.connection.executemany(
+                "INSERT INTO rows (id, chunk_id, text, file_path, file_ext, modified_at, "
+                "start_line, end_line) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        position,
+                        id,
+                        text,
+                        file_path,
+                        file_extension(file_path),
+                        int(modified_at),
+                        start_line,
+                        end_line,
+                    )
+                    for position, id, text, file_path, modified_at, start_line, end_line in zip(
+                        positions, ids, texts, file_paths, modified_ats, start_lines, end_lines
+                    )
+                ),
+            )
+            self._set_info("count", count + len(texts))
+            self._set_info("version", self._get_info("version", 0) + 1)
+            self.connection.commit()
+            return list(ids)
+
+    def upsert(
+        self,
+        ids: List[int],
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: Optional[List[int]] = None,
+        end_lines: Optional[List[int]] = None,
+        modified_ats: Optional[List[int]] = None,
+    ) -> List[int]:
+        with self.lock:
+            self._execute_with_ids(
+                "UPDATE rows SET deleted = 1 WHERE deleted = 0 AND chunk_id IN ({ids})", ids
+            )
+            # insert commits both
+            return self.insert(
+                texts, file_paths, vectors, start_lines, end_lines, ids, modified_ats
+            )
+
+    def _execute_with_ids(self, statement: str, ids: List[int], parameters=()) -> sqlite3.Cursor:
+        """Runs the statement with the ids in a temporary table,
+        SQLite limits the number of parameters of a statement."""
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS chunk_ids (chunk_id INTEGER)")
+        self.connection.execute("DELETE FROM chunk_ids")
+        self.connection.executemany(
+            "INSERT INTO chunk_ids (chunk_id) VALUES (?)", ((id,) for id in ids)
+        )
+        return self.connection.execute(
+            statement.format(ids="SELECT chunk_id FROM chunk_ids"), parameters
+        )
+
+    def delete_by_paths(
+        self,
+        file_paths: List[str],
+        batch_size: int = 100,
+        keep_ids: Optional[List[int]] = None,
+    ) -> int:
+        if not file_paths:
+            return 0
+        with self.lock:
+            deleted = 0
+            for i in range(0, len(file_paths), batch_size):
+                batch = file_paths[i : i + batch_size]
+                placeholders = ", ".join("?" * len(batch))
+                statement = (
+                    "UPDATE rows SET deleted = 1 WHERE deleted = 0 "
+                    f"AND file_path IN ({placeholders})"
+                )
+                if keep_ids:
+                    deleted += self._execute_with_ids(
+                        statement + " AND chunk_id NOT IN ({ids})", keep_ids, batch
+                    ).rowcount
+                else:
+                    deleted += self.connection.execute(statement, batch).rowcount
+            if deleted:
+                self._set_info("version", self._get_info("version", 0) + 1)
+            self.connection.commit()
+
+            (garbage,) = self.connection.execute(
+                "SELECT COUNT(*) FROM rows WHERE deleted = 1"
+            ).fetchone()
+            if garbage > 1000 and garbage * 2 > self._get_info("count", 0):
+                self._compact()
+            return deleted
+
+    def _compact(self):
+        """Rewrites the vectors and the rows without the deleted ones"""
+        self._open_vectors()
+        alive_ids = [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT id FROM rows WHERE deleted = 0 ORDER BY id"
+            )
+        ]
+        generation = self._get_info("generation", 0) + 1
+        new_path = self._vectors_path(generation)
+        new_vectors = np.memmap(
+            new_path, dtype=np.float32, mode="w+", shape=(max(len(alive_ids), 1), self.dim)
+        )
+        for start in range(0, len(alive_ids), 8192):
+            block = alive_ids[start : start + 8192]
+            new_vectors[start : start + len(block)] = self.vectors[block]
+        new_vectors.flush()
+        del new_vectors
+
+        # The ids are the positions in the file, so they are renumbered. The
+        # rows and the info switch to the new file in a single transaction,
+        # executescript would commit each statement on its own.
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute(
+                """
+                CREATE TEMP TABLE alive AS
+                    SELECT chunk_id, text, file_path, file_ext, modified_at,
+                        start_line, end_line
+                    FROM rows WHERE deleted = 0 ORDER BY id
+                """
+            )
+            self.connection.execute("DELETE FROM rows")
+            self.connection.execute(
+                """
+                INSERT INTO rows (
+                    id, chunk_id, text, file_path, file_ext, modified_at,
+                    start_line, end_line
+                )
+                    SELECT rowid - 1, chunk_id, text, file_path, file_ext, modified_at,
+                        start_line, end_line
+                    FROM alive
+                """
+            )
+            self.connection.execute("DROP TABLE alive")
+            self._set_info("count", len(alive_ids))
+            self._set_info("generation", generation)
+            self._set_info("version", self._get_info("version", 0) + 1)
+
+        self._close_vectors()
+        self._remove_stale_files()
+        print(f"Compacted the collection {self.collection_name} to {len(alive_ids)} vectors.")
+
+    def _refresh(self):
+        """Loads the norms, the compressed codes, the deleted marks and the IVF index,
+        unless nothing was written since the last search."""
+        version = (self._get_info("generation", 0), self._get_info("version", 0))
+        if self.state is not None and self.state["version"] == version:
+            return
+
+        count = self._get_info("count", 0)
+        self._open_vectors()
+        alive = np.zeros(count, dtype=bool)
+        alive_ids = np.fromiter(
+            (row[0] for row in self.connection.execute("SELECT id FROM rows WHERE deleted = 0")),
+            dtype=np.int64,
+        )
+        alive[alive_ids] = True
+        matrix = self.vectors[:count] if count else np.zeros((0, self.dim), np.float32)
+
+        # Within a generation rows are only appended, so the norms and the
+        # codes of the rows seen before are still good
+        norms = np.empty(count, dtype=np.float32)
+        codes = scales = None
+        if self.codes != "float32":
+            codes = np.empty((count, self.dim), np.float16 if self.codes == "float16" else np.int8)
+            scales = np.empty(count, np.float32) if self.codes == "int8" else None
+        previous = self.state
+        known = 0
+        if (
+            previous is not None
+            and previous["version"][0] == version[0]
+            and (previous["codes"] is None) == (codes is None)
+            and (codes is None or previous["codes"].dtype == codes.dtype)
+        ):
+            known = min(len(previous["norms"]), count)
+            norms[:known] = previous["norms"][:known]
+            if codes is not None:
+                codes[:known] = previous["codes"][:known]
+            if scales is not None:
+                scales[:known] = previous["scales"][:known]
+        for start in range(known, count, 8192):
+            block = np.asarray(matrix[start : start + 8192])
+            norms[start : start + len(block)] = np.einsum("ij,ij->i", block, block)
+            if codes is not None:
+                block_codes, block_scales = encode_vectors(block, self.codes)
+                codes[start : start + len(block)] = block_codes
+                if scales is not None:
+                    scales[start : start + len(block)] = block_scales
+
+        self.state = {
+            "version": version,
+            "matrix": matrix,
+            "norms": norms,
+            "codes": codes,
+            "scales": scales,
+            "alive": alive,
+            "ivf": None,
+        }
+        use_ivf = self.index_type == "ivf" or (
+            self.index_type == "auto" and len(alive_ids) >= self.ivf_min_rows
+        )
+        if use_ivf and len(alive_ids):
+            self.state["ivf"] = self._load_ivf(matrix, alive_ids)
+
+    def _load_ivf(self, matrix: np.ndarray, alive_ids: np.ndarray) -> Dict[str, Any]:
+        """The stored index, with the rows inserted since then assigned to
+        their nearest list. It is trained again once the collection doubled."""
+        path = self._ivf_path()
+        centroids = assignments = None
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                centroids, assignments = stored["centroids"], stored["assignments"]
+            if len(assignments) * 2 < len(matrix):
+                centroids = None
+
+        if centroids is None:
+            centroids = self._train_centroids(matrix, alive_ids)
+            assignments = np.zeros(0, dtype=np.int32)
+        if len(assignments) < len(matrix):
+            new = self._assign(matrix[len(assignments) :], centroids)
+            assignments = np.concatenate([assignments, new])
+            # Written aside and swapped in, other processes might be reading
+            temporary_path = path + ".tmp.npz"
+            np.savez(temporary_path, centroids=centroids, assignments=assignments)
+            os.replace(temporary_path, path)
+
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        return {"centroids": centroids, "order": order, "bounds": bounds}
+
+    def _train_centroids(self, matrix: np.ndarray, alive_ids: np.ndarray, iterations: int = 10):
+        nlist = max(1, int(np.sqrt(len(alive_ids))))
+        rng = np.random.default_rng(0)
+        sample_ids = np.sort(
+            rng.choice(alive_ids, size=min(len(alive_ids), nlist * 64), replace=False)
+        )
+        sample = np.asarray(matrix[sample_ids])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    @staticmethod
+    def _assign(rows: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        labels = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), 8192):
+            block = np.asarray(rows[start : start + 8192])
+            # |x - c|^2 without the |x|^2, which is the same for every c
+            distances = centroid_norms - 2 * block @ centroids.T
+            labels[start : start + len(block)] = distances.argmin(axis=1)
+        return labels
+
+    def search_many(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self.lock:
+            self._refresh()
+            allowed = self._allowed_rows(filters)
+            ivf = self.state["ivf"]
+            # Scanning a quarter of the lists one by one is already slower
+            # than one pass over everything
+            if ivf is None or 4 * self._nprobe(len(ivf["centroids"])) >= len(ivf["centroids"]):
+                hits = self._search_exact(queries, allowed, top_k)
+            else:
+                hits = [self._search_ivf(query, allowed, top_k) for query in queries]
+            rows = self._fetch_rows({id for query_hits in hits for id, _ in query_hits})
+
+        return [
+            [
+                {
+                    "id": rows[position][1],
+                    "distance": distance,
+                    "text": rows[position][2],
+                    "file_path": rows[position][3],
+                    "start_line": rows[position][4],
+                    "end_line": rows[position][5],
+                }
+                for position, distance in query_hits
+                if position in rows
+            ]
+            for query_hits in hits
+        ]
+
+    def _allowed_rows(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """The rows a search may return: alive and matching the filters"""
+        alive = self.state["alive"]
+        if not filters:
+            return alive
+        conditions, parameters = make_sql_filter(filters, "rows")
+        conditions = ["deleted = 0", *conditions]
+        ids = np.fromiter(
+            (
+                row[0]
+                for row in self.connection.execute(
+                    f"SELECT id FROM rows WHERE {' AND '.join(conditions)}", parameters
+                )
+            ),
+            dtype=np.int64,
+        )
+        allowed = np.zeros_like(alive)
+        allowed[ids[ids < len(alive)]] = True
+        return allowed
+
+    @staticmethod
+    def _best(candidates: np.ndarray, distances: np.ndarray, query_norm: float, top_k: int):
+        top_k = min(top_k, len(candidates))
+        if not top_k:
+            return []
+        best = np.argpartition(distances, top_k - 1)[:top_k]
+        best = best[np.argsort(distances[best])]
+        # The squared L2 distance, like the L2 metric of Milvus
+        return [
+            (int(candidates[i]), max(0.0, float(distances[i]) + query_norm)) for i in best
+        ]
+
+    def _search_exact(self, queries: np.ndarray, allowed: np.ndarray, top_k: int):
+        candidates = np.flatnonzero(allowed)
+        if not len(candidates):
+            return [[] for _ in queries]
+        # One pass over the vectors for all the queries. |x - q|^2 is
+        # |x|^2 - 2 x.q + |q|^2, the last term is added for the winners only.
+        distances = self.state["norms"][:, None] - 2 * self._dot(None, queries.T)
+        if len(candidates) < len(allowed):
+            distances = distances[candidates]
+        return [
+            self._rerank(candidates, distances[:, i], query, top_k)
+            for i, query in enumerate(queries)
+        ]
+
+    def _dot(self, rows: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """The dot products of the rows (all of them for None) with the
+        queries, from the compressed codes when there are any"""
+        codes = self.state["codes"]
+        if codes is None:
+            matrix = self.state["matrix"]
+            return (matrix if rows is None else matrix[rows]) @ queries
+        if rows is not None:
+            codes = codes[rows]
+        products = np.empty((len(codes),) + queries.shape[1:], dtype=np.float32)
+        # Converted block by block, a float32 copy of all of them is what
+        # the codes are there to avoid
+        for start in range(0, len(codes), 8192):
+            block = codes[start : start + 8192].astype(np.float32)
+            products[start : start + len(block)] = block @ queries
+        if self.state["scales"] is not None:
+            scales = self.state["scales"] if rows is None else self.state["scales"][rows]
+            products *= scales.reshape((-1,) + (1,) * (products.ndim - 1))
+        return products
+
+    def _rerank(self, candidates: np.ndarray, distances: np.ndarray, query: np.ndarray, top_k: int):
+        """The best hits. Distances from compressed codes are approximate, so
+        rerank_factor times more hits are measured again on the full vectors."""
+        query_norm = float(query @ query)
+        if self.state["codes"] is None:
+            return self._best(candidates, distances, query_norm, top_k)
+        best = self._best(candidates, distances, query_norm, top_k * self.rerank_factor)
+        # Sorted, the float32 rows are read in file order
+        shortlist = np.sort(np.array([row for row, _ in best], dtype=np.int64))
+        exact = self.state["norms"][shortlist] - 2 * (
+            np.asarray(self.state["matrix"][shortlist]) @ query
+        )
+        return self._best(shortlist, exact, query_norm, top_k)
+
+    def _nprobe(self, nlist: int) -> int:
+        return min(self.nprobe or choose_nprobe(nlist, self.target_recall), nlist)
+
+    def _search_ivf(self, query: np.ndarray, allowed: np.ndarray, top_k: int):
+        ivf = self.state["ivf"]
+        centroid_distances = np.einsum(
+            "ij,ij->i", ivf["centroids"], ivf["centroids"]
+        ) - 2 * (ivf["centroids"] @ query)
+        nprobe = self._nprobe(len(ivf["centroids"]))
+        lists = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        candidates = np.concatenate(
+            [ivf["order"][ivf["bounds"][i] : ivf["bounds"][i + 1]] for i in lists]
+        )
+        candidates = np.sort(candidates[allowed[candidates]])
+        distances = self.state["norms"][candidates] - 2 * self._dot(candidates, query)
+        return self._rerank(candidates, distances, query, top_k)
+
+    def get_vectors(self, ids: List[int]) -> Dict[int, List[float]]:
+        if not ids:
+            return {}
+        with self.lock:
+            positions = self._execute_with_ids(
+                "SELECT id, chunk_id FROM rows WHERE deleted = 0 AND chunk_id IN ({ids})", ids
+            ).fetchall()
+            self._open_vectors()
+            return {
+                chunk_id: self.vectors[position].tolist() for position, chunk_id in positions
+            }
+
+    def _fetch_rows(self, ids) -> Dict[int, tuple]:
+        ids = list(ids)
+        rows = {}
+        # SQLite limits the number of parameters of a statement
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            for row in self.connection.execute(
+                "SELECT id, chunk_id, text, file_path, start_line, end_line FROM rows "
+                f"WHERE id IN ({', '.join('?' * len(batch))})",
+                batch,
+            ):
+                rows[row[0]] = row
+        return rows
+
+    def drop_collection(self) -> bool:
+        with self.lock:
+            self._close_vectors()
+            self.connection.close()
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return True
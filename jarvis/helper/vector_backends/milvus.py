@@ -0,0 +1,381 @@
+from pymilvus import connections, Collection, CollectionSchema, DataType, FieldSchema, utility
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import os
+import secrets
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from jarvis.helper.vector_backends.base import (
+    VectorBackend,
+    file_extension,
+    make_chunk_ids,
+    normalize_extensions,
+)
+from jarvis.helper.vector_backends.tuning import (
+    IVF_INDEX_TYPES,
+    choose_index_params,
+    choose_nlist,
+    choose_search_params,
+    get_rerank_factor,
+    is_compressed,
+)
+
+load_dotenv()
+
+# Connecting, creating a Collection handle and above all loading a collection
+# into memory are slow, so all of them are done once per process. Loaded
+# collections stay loaded, a long running process (like the watch mode)
+# releases the ones nobody searched for MILVUS_RELEASE_AFTER_SECONDS.
+# _lock only guards the dicts; loading and releasing a collection hold the
+# lock of that collection, so a slow load doesn't stall the other ones.
+_lock = threading.Lock()
+_aliases: Dict[Tuple[str, str], str] = {}
+_collections: Dict[Tuple[str, str], Collection] = {}
+_collection_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_last_searched: Dict[Tuple[str, str], float] = {}
+_releaser: threading.Thread | None = None
+
+
+def get_connection(host: str, port: str) -> str:
+    """Connects once per host and port, returns the alias of the connection"""
+    with _lock:
+        if (host, port) not in _aliases:
+            alias = f"{host}:{port}"
+            connections.connect(alias=alias, host=host, port=port)
+            _aliases[(host, port)] = alias
+        return _aliases[(host, port)]
+
+
+def get_collection(alias: str, name: str) -> Collection:
+    with _lock:
+        if (alias, name) not in _collections:
+            _collections[(alias, name)] = Collection(name, using=alias)
+        return _collections[(alias, name)]
+
+
+def _collection_lock(key: Tuple[str, str]) -> threading.Lock:
+    with _lock:
+        return _collection_locks.setdefault(key, threading.Lock())
+
+
+def get_loaded_collection(alias: str, name: str) -> Collection:
+    """The collection, loaded into memory. Only the first search pays for it,
+    the concurrent ones wait for that load."""
+    key = (alias, name)
+    collection = get_collection(alias, name)
+    with _lock:
+        if key in _last_searched:
+            _last_searched[key] = time.monotonic()
+            return collection
+
+    with _collection_lock(key):
+        with _lock:
+            loaded = key in _last_searched
+        if not loaded:
+            # Loading an already loaded collection is a cheap no-op,
+            # another process may have loaded it before.
+            collection.load()
+        with _lock:
+            _last_searched[key] = time.monotonic()
+            _start_releaser()
+    return collection
+
+
+def forget_collection(alias: str, name: str):
+    with _lock:
+        _collections.pop((alias, name), None)
+        _last_searched.pop((alias, name), None)
+
+
+def release_collection(alias: str, name: str):
+    """Releases the collection, the next search loads it again"""
+    key = (alias, name)
+    collection = get_collection(alias, name)
+    with _collection_lock(key):
+        with _lock:
+            _last_searched.pop(key, None)
+        collection.release()
+
+
+def _start_releaser():
+    global _releaser
+    release_after = float(os.getenv("MILVUS_RELEASE_AFTER_SECONDS", "1800"))
+    if release_after <= 0 or _releaser is not None:
+        return
+    _releaser = threading.Thread(
+        target=_release_idle_collections, args=(release_after,), daemon=True
+    )
+    _releaser.start()
+
+
+def _is_idle(key: Tuple[str, str], release_after: float) -> bool:
+    last_searched = _last_searched.get(key)
+    return last_searched is not None and time.monotonic() - last_searched > release_after
+
+
+def _release_idle_collections(release_after: float):
+    while True:
+        time.sleep(min(release_after / 2, 60))
+        with _lock:
+            idle = [key for key in _last_searched if _is_idle(key, release_after)]
+        for key in idle:
+            with _collection_lock(key):
+                with _lock:
+                    # Searched again (or forgotten) in the meantime
+                    if not _is_idle(key, release_after) or key not in _collections:
+                        continue
+                    del _last_searched[key]
+                    collection = _collections[key]
+                try:
+                    collection.release()
+                except Exception as e:
+                    print(f"Error releasing the collection {key[1]}: {str(e)}")
+
+class MilvusBackend(VectorBackend):
+    """The collection lives in a Milvus standalone (see docker-compose.yml)"""
+
+    def __init__(self, collection_name: str = "project_files", host: str = "localhost", port: str = "19530", dim: int = 1536):
+        super().__init__(collection_name, dim)
+        self.host = host
+        self.port = port
+        self.alias = get_connection(self.host, self.port)
+        # The params of the vector index, read from the collection when needed
+        self._index_params = None
+
+        # Check and create collection if doesn't exist
+        if utility.has_collection(self.collection_name, using=self.alias) and not self._has_current_schema():
+            # Collections from before the line ranges, the chunk ids
+            # and the file metadata have to be indexed again
+            print(f"The collection {self.collection_name} is outdated, recreating it.")
+            self.drop_collection()
+        if not utility.has_collection(self.collection_name, using=self.alias):
+            self._create_collection()
+            self.created = True
+        # Collections from before the ids have an empty description
+        self.store_id = get_collection(self.alias, self.collection_name).description
+
+    def _has_current_schema(self) -> bool:
+        collection = get_collection(self.alias, self.collection_name)
+        field_names = {field.name for field in collection.schema.fields}
+        required = {"start_line", "end_line", "file_ext", "modified_at"}
+        return required <= field_names and not collection.schema.auto_id
+
+    def _create_collection(self):
+        fields = [
+            # The chunk id, stable for a path and position (see make_chunk_id)
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+            FieldSchema(name="file_path", dtype=DataType.VARCHAR, max_length=65535),
+            # ".cs" for Player.cs, and when the file was modified (epoch seconds)
+            FieldSchema(name="file_ext", dtype=DataType.VARCHAR, max_length=64),
+            FieldSchema(name="modified_at", dtype=DataType.INT64),
+            # The lines of the file the chunk covers, 1-based and inclusive
+            FieldSchema(name="start_line", dtype=DataType.INT64),
+            FieldSchema(name="end_line", dtype=DataType.INT64),
+            FieldSchema(name="embeddings", dtype=DataType.FLOAT_VECTOR, dim=self.dim)
+        ]
+        # The description identifies this collection, see VectorBackend.store_id
+        schema = CollectionSchema(fields, description=f"jarvis {secrets.token_hex(8)}")
+        collection = Collection(self.collection_name, schema, using=self.alias)
+        
+        # An empty collection starts with FLAT, tune_index moves it
+        # to IVF_FLAT and HNSW (or a compressed IVF) as it grows
+        self._index_params = choose_index_params(0, self.dim)
+        collection.create_index(
+            field_name="embeddings", index_params=self._index_params, index_name="embeddings"
+        )
+        # Deleting the rows of a file and the scoped searches filter by
+        # these, without an index every filter scans all the rows
+        for field_name in ("file_path", "file_ext", "modified_at"):
+            collection.create_index(
+                field_name=field_name,
+                index_name=field_name,
+                index_params={"index_type": "INVERTED"},
+            )
+        with _lock:
+            _collections[(self.alias, self.collection_name)] = collection
+        return collection
+
+    def _get_vector_index(self):
+        collection = get_collection(self.alias, self.collection_name)
+        for index in collection.indexes:
+            if index.field_name == "embeddings":
+                return index
+        return None
+
+    @property
+    def index_params(self) -> Dict[str, Any]:
+        if self._index_params is None:
+            index = self._get_vector_index()
+            self._index_params = (
+                dict(index.params) if index else choose_index_params(0, self.dim)
+            )
+        return self._index_params
+
+    def flush(self):
+        # Seals the growing segments, so the rows get indexed and counted
+        get_collection(self.alias, self.collection_name).flush()
+
+    def tune_index(self) -> bool:
+        """Rebuilds the vector index when the row count crossed into another
+        kind of index, or an IVF index has far too few or too many lists"""
+        collection = get_collection(self.alias, self.collection_name)
+        self.flush()
+        rows = collection.num_entities
+        wanted = choose_index_params(rows, self.dim)
+        current = self.index_params
+        if wanted["index_type"] == current.get("index_type"):
+            if wanted["index_type"] not in IVF_INDEX_TYPES:
+                return False
+            nlist = int((current.get("params") or {}).get("nlist", 1))
+            if choose_nlist(rows) / 4 <= nlist <= choose_nlist(rows) * 4:
+                return False
+
+        print(
+            f"Rebuilding the index of {self.collection_name} for {rows} rows: "
+            f"{current.get('index_type')} -> {wanted['index_type']}"
+        )
+        self.rebuild_index(wanted)
+        return True
+
+    def rebuild_index(self, index_params: Dict[str, Any]):
+        collection = get_collection(self.alias, self.collection_name)
+        # The index can't be dropped while the collection is loaded
+        release_collection(self.alias, self.collection_name)
+        index = self._get_vector_index()
+        if index:
+            collection.drop_index(index_name=index.index_name)
+        collection.create_index(
+            field_name="embeddings", index_params=index_params, index_name="embeddings"
+        )
+        self._index_params = index_params
+
+    def insert(self, texts: List[str], file_paths: List[str], vectors: List[List[float]],
+               start_lines: List[int] = None, end_lines: List[int] = None,
+               ids: List[int] = None, modified_ats: List[int] = None) -> List[int]:
+        collection = get_collection(self.alias, self.collection_name)
+        mr = collection.insert(
+            self._make_data(ids, texts, file_paths, vectors, start_lines, end_lines, modified_ats)
+        )
+        return mr.primary_keys
+
+    def upsert(self, ids: List[int], texts: List[str], file_paths: List[str], vectors: List[List[float]],
+               start_lines: List[int] = None, end_lines: List[int] = None,
+               modified_ats: List[int] = None) -> List[int]:
+        collection = get_collection(self.alias, self.collection_name)
+        mr = collection.upsert(
+            self._make_data(ids, texts, file_paths, vectors, start_lines, end_lines, modified_ats)
+        )
+        return mr.primary_keys
+
+    def _make_data(
+        self, ids, texts, file_paths, vectors, start_lines, end_lines, modified_ats
+    ) -> List[List[Any]]:
+        ids = ids or make_chunk_ids(file_paths)
+        # Without line ranges a chunk covers the whole file (end_line 0)
+        start_lines = start_lines or [1] * len(texts)
+        end_lines = end_lines or [0] * len(texts)
+        modified_ats = [int(modified_at) for modified_at in modified_ats or [0] * len(texts)]
+        file_exts = [file_extension(file_path) for file_path in file_paths]
+        return [ids, texts, file_paths, file_exts, modified_ats, start_lines, end_lines, vectors]
+
+    def make_expression(self, filters: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Turns the search filters into a Milvus boolean expression"""
+        if not filters:
+            return None
+        expressions = []
+        if filters.get("file_paths") is not None:
+            expressions.append(f"file_path in {json.dumps(list(filters['file_paths']))}")
+        if filters.get("path_prefix"):
+            # % and _ are wildcards of like, so they are escaped
+            prefix = filters["path_prefix"].replace("\\", "\\\\")
+            prefix = prefix.replace("%", "\\%").replace("_", "\\_")
+            expressions.append(f"file_path like {json.dumps(prefix + '%')}")
+        if filters.get("extensions"):
+            extensions = normalize_extensions(filters["extensions"])
+            expressions.append(f"file_ext in {json.dumps(extensions)}")
+        if filters.get("modified_after") is not None:
+            expressions.append(f"modified_at > {int(filters['modified_after'])}")
+        return " and ".join(expressions) or None
+
+    def search_many(self, query_vectors: List[List[float]], top_k: int = 5,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        collection = get_loaded_collection(self.alias, self.collection_name)
+
+        search_params = choose_search_params(self.index_params, top_k, self.target_recall)
+        output_fields = ["text", "file_path", "start_line", "end_line"]
+        # The distances of a compressed index are approximate, more hits
+        # are fetched with their full vectors and re-ranked
+        rerank = is_compressed(self.index_params)
+        limit = top_k * get_rerank_factor() if rerank else top_k
+        if rerank:
+            output_fields.append("embeddings")
+
+        results = collection.search(
+            data=query_vectors,
+            anns_field="embeddings",
+            param=search_params,
+            limit=limit,
+            expr=self.make_expression(filters),
+            output_fields=output_fields
+        )
+        
+        search_results = []
+        for query_vector, hits in zip(query_vectors, results):
+            search_results.append([])
+            for hit in hits:
+                search_results[-1].append({
+                    "id": hit.id,
+                    "distance": hit.distance,
+                    "text": hit.entity.get('text'),
+                    "file_path": hit.entity.get('file_path'),
+                    "start_line": hit.entity.get('start_line'),
+                    "end_line": hit.entity.get('end_line')
+                })
+            if rerank and hits:
+                vectors = np.asarray([hit.entity.get("embeddings") for hit in hits], dtype=np.float32)
+                distances = ((vectors - np.asarray(query_vector, dtype=np.float32)) ** 2).sum(axis=1)
+                for result, distance in zip(search_results[-1], distances):
+                    result["distance"] = float(distance)
+                search_results[-1].sort(key=lambda result: result["distance"])
+                del search_results[-1][top_k:]
+
+        return search_results
+
+    def get_vectors(self, ids: List[int]) -> Dict[int, List[float]]:
+        if not ids:
+            return {}
+        collection = get_loaded_collection(self.alias, self.collection_name)
+        rows = collection.query(
+            expr=f"id in {json.dumps(list(ids))}", output_fields=["id", "embeddings"]
+        )
+        return {row["id"]: list(row["embeddings"]) for row in rows}
+
+    def delete_by_paths(self, file_paths: List[str], batch_size: int = 100,
+                        keep_ids: List[int] = None) -> int:
+        if not file_paths:
+            return 0
+
+        collection = get_collection(self.alias, self.collection_name)
+        deleted = 0
+        for i in range(0, len(file_paths), batch_size):
+            batch = file_paths[i : i + batch_size]
+            # json.dumps gives a double quoted, escaped list literal,
+            # which is exactly what the Milvus expressions expect.
+            expression = f"file_path in {json.dumps(batch)}"
+            if keep_ids:
+                expression += f" and id not in {json.dumps(list(keep_ids))}"
+            mr = collection.delete(expression)
+            deleted += mr.delete_count
+        return deleted
+
+    def drop_collection(self):
+        """Drop the collection if it exists"""
+        if utility.has_collection(self.collection_name, using=self.alias):
+            get_collection(self.alias, self.collection_name).drop()
+            forget_collection(self.alias, self.collection_name)
+            self._index_params = None
+            return True
+        return False
\ No newline at end of file
@@ -0,0 +1,145 @@
+import math
+import os
+from typing import Any, Dict, List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Below this many rows a brute force scan is fast and exact, above it an
+# index pays off. Beyond HNSW_MIN_ROWS even scanning a few IVF lists gets
+# slow and the graph index is worth its memory.
+FLAT_MAX_ROWS = int(os.getenv("VECTOR_FLAT_MAX_ROWS", "20000"))
+HNSW_MIN_ROWS = int(os.getenv("VECTOR_HNSW_MIN_ROWS", "1000000"))
+
+# Past FLAT_MAX_ROWS the index can hold compressed vectors instead: sq8 keeps
+# a byte per dimension, pq a byte per 8 dimensions. The hits are re-ranked
+# on the full vectors, VECTOR_RERANK_FACTOR times top_k of them.
+COMPRESSED_INDEX_TYPES = {"sq8": "IVF_SQ8", "pq": "IVF_PQ"}
+IVF_INDEX_TYPES = {"IVF_FLAT", "IVF_SQ8", "IVF_PQ"}
+
+# (target recall, share of the IVF lists to scan). How many lists a recall
+# takes depends on how clustered the embeddings are, this errs on the safe
+# side. benchmarks/recall_benchmark.py shows what it gives (--spread makes
+# the vectors harder), re-check there when changing it.
+PROBE_SHARES: List[Tuple[float, float]] = [
+    (0.8, 0.02),
+    (0.9, 0.05),
+    (0.95, 0.1),
+    (0.99, 0.3),
+    (1.0, 1.0),
+]
+# (target recall, HNSW ef as a multiple of top_k)
+EF_FACTORS: List[Tuple[float, float]] = [
+    (0.8, 2),
+    (0.9, 4),
+    (0.95, 8),
+    (0.99, 24),
+    (1.0, 64),
+]
+
+
+def get_target_recall() -> float:
+    """The share of the true nearest neighbours a search should find"""
+    return min(1.0, max(0.5, float(os.getenv("VECTOR_TARGET_RECALL", "0.95"))))
+
+
+def get_compression() -> str:
+    compression = os.getenv("VECTOR_COMPRESSION", "none").lower()
+    if compression not in ("none", *COMPRESSED_INDEX_TYPES):
+        raise ValueError(f"Invalid vector compression: {compression}. Must be 'none', 'sq8' or 'pq'.")
+    return compression
+
+
+def get_rerank_factor() -> int:
+    return max(1, int(os.getenv("VECTOR_RERANK_FACTOR", "4")))
+
+
+def index_kind(rows: int, compression: str | None = None) -> str:
+    if rows < FLAT_MAX_ROWS:
+        return "FLAT"
+    compression = compression or get_compression()
+    if compression in COMPRESSED_INDEX_TYPES:
+        return COMPRESSED_INDEX_TYPES[compression]
+    if rows < HNSW_MIN_ROWS:
+        return "IVF_FLAT"
+    return "HNSW"
+
+
+def choose_nlist(rows: int) -> int:
+    # The usual rule of thumb, with at least a few hundred vectors per list
+    return max(1, min(65536, int(4 * math.sqrt(rows)), rows // 256 or 1))
+
+
+def choose_pq_m(dim: int) -> int:
+    """Sub-vectors of about 8 dimensions, m has to divide dim"""
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def choose_index_params(
+    rows: int, dim: int = 1536, compression: str | None = None
+) -> Dict[str, Any]:
+    """The Milvus index for a collection of this many rows"""
+    kind = index_kind(rows, compression)
+    if kind == "FLAT":
+        params = {}
+    elif kind == "IVF_PQ":
+        params = {"nlist": choose_nlist(rows), "m": choose_pq_m(dim), "nbits": 8}
+    elif kind in IVF_INDEX_TYPES:
+        params = {"nlist": choose_nlist(rows)}
+    else:
+        params = {"M": 16, "efConstruction": 200}
+    return {"index_type": kind, "metric_type": "L2", "params": params}
+
+
+def is_compressed(index_params: Dict[str, Any]) -> bool:
+    return index_params.get("index_type") in COMPRESSED_INDEX_TYPES.values()
+
+
+def estimate_index_bytes(index_params: Dict[str, Any], rows: int, dim: int) -> int:
+    """Roughly what the vectors of the index take in memory"""
+    kind = index_params.get("index_type")
+    params = index_params.get("params") or {}
+    if kind == "IVF_SQ8":
+        return rows * dim
+    if kind == "IVF_PQ":
+        return rows * int(params.get("m", choose_pq_m(dim))) * int(params.get("nbits", 8)) // 8
+    if kind == "HNSW":
+        # The float32 vectors plus about 2 * M links of 4 bytes
+        return rows * (dim * 4 + 8 * int(params.get("M", 16)))
+    return rows * dim * 4
+
+
+def interpolate(points: List[Tuple[float, float]], target: float) -> float:
+    if target <= points[0][0]:
+        return points[0][1]
+    for (low, low_value), (high, high_value) in zip(points, points[1:]):
+        if target <= high:
+            return low_value + (high_value - low_value) * (target - low) / (high - low)
+    return points[-1][1]
+
+
+def choose_nprobe(nlist: int, target_recall: float) -> int:
+    return max(1, min(nlist, math.ceil(nlist * interpolate(PROBE_SHARES, target_recall))))
+
+
+def choose_ef(top_k: int, target_recall: float) -> int:
+    # Milvus wants ef >= top_k, and below 16 the graph search gets erratic
+    return max(16, top_k, math.ceil(top_k * interpolate(EF_FACTORS, target_recall)))
+
+
+def choose_search_params(
+    index_params: Dict[str, Any], top_k: int, target_recall: float
+) -> Dict[str, Any]:
+    """The search parameters for an index, as the search param of Milvus"""
+    params = index_params.get("params") or {}
+    kind = index_params.get("index_type")
+    if kind in IVF_INDEX_TYPES:
+        search = {"nprobe": choose_nprobe(int(params.get("nlist", 1)), target_recall)}
+    elif kind == "HNSW":
+        search = {"ef": choose_ef(top_k, target_recall)}
+    else:
+        search = {}
+    return {"metric_type": "L2", "params": search}
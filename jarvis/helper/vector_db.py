@@ -1,83 +1,199 @@
-from pymilvus import connections, Collection, CollectionSchema, DataType, FieldSchema, utility
-from typing import List, Dict, Any, Tuple
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from jarvis.helper.lexical_index import LexicalIndex
+from jarvis.helper.vector_backends.base import VectorBackend, make_chunk_ids
+
+load_dotenv()
+
+
+def get_backend_class(name: str | None = None) -> type[VectorBackend]:
+    """The backend named by VECTOR_DB_BACKEND, 'milvus' or 'local'.
+    Imported on demand, so the local one starts without pymilvus."""
+    name = (name or os.getenv("VECTOR_DB_BACKEND", "milvus")).lower()
+    if name == "milvus":
+        from jarvis.helper.vector_backends.milvus import MilvusBackend
+
+        return MilvusBackend
+    if name == "local":
+        from jarvis.helper.vector_backends.local import LocalBackend
+
+        return LocalBackend
+    raise ValueError(f"Invalid vector db backend: {name}. Must be 'milvus' or 'local'.")
+
 
 class VectorDB:
-    def __init__(self, collection_name: str = "project_files", host: str = "localhost", port: str = "19530", dim: int = 1536):
-        self.host = host
-        self.port = port
-        self.dim = dim
+    """The vectors of a project collection. Milvus by default, or with
+    VECTOR_DB_BACKEND=local an embedded store that needs no services.
+    Every write also goes to the lexical index of the collection, so
+    the chunks can be searched by the identifiers in them as well."""
+
+    def __init__(
+        self,
+        collection_name: str = "project_files",
+        dim: int = 1536,
+        backend: str | None = None,
+        **kwargs,
+    ):
         self.collection_name = collection_name
-        self._connect()
-        
+        self.dim = dim
+        self.backend = get_backend_class(backend)(
+            collection_name=collection_name, dim=dim, **kwargs
+        )
+        self.lexical = LexicalIndex(collection_name)
+        if self.backend.created:
+            self.lexical.reset()
+        # A collection indexed before there was a lexical index has to be
+        # indexed again as well, the upserts replace its rows
+        self.created = self.backend.created or self.lexical.created
+        # Changes whenever one of the two stores was created again
+        self.store_id = f"{self.backend.store_id}/{self.lexical.store_id}"
+        # A text alone can be 64 KB, a write is cut into requests of about
+        # this size so that none hits the gRPC message limit of Milvus
+        self.max_batch_bytes = int(os.getenv("VECTOR_INSERT_BATCH_BYTES", str(16 * 1024 * 1024)))
 
+    def row_bytes(self, text: str, file_path: str) -> int:
+        # The vector, the text, the path and a little for the line numbers and the id
+        return self.dim * 4 + len(text.encode("utf-8")) + len(file_path.encode("utf-8")) + 32
 
-        # Check and create collection if doesn't exist
-        if not utility.has_collection(self.collection_name):
-            self._create_collection()
+    def batch_bounds(self, texts: List[str], file_paths: List[str]) -> Iterator[Tuple[int, int]]:
+        """Cuts the rows into ranges of at most max_batch_bytes (at least one row)"""
+        start = size = 0
+        for i, (text, file_path) in enumerate(zip(texts, file_paths)):
+            row_size = self.row_bytes(text, file_path)
+            if i > start and size + row_size > self.max_batch_bytes:
+                yield start, i
+                start, size = i, 0
+            size += row_size
+        if start < len(texts):
+            yield start, len(texts)
 
-    def _connect(self):
-        connections.connect(
-            alias="default",
-            host=self.host,
-            port=self.port
-        )
+    def _write(
+        self, write, ids, texts, file_paths, vectors, start_lines, end_lines, modified_ats
+    ) -> List[int]:
+        # Without line ranges a chunk covers the whole file (end_line 0)
+        start_lines = start_lines or [1] * len(texts)
+        end_lines = end_lines or [0] * len(texts)
+        modified_ats = modified_ats or [0] * len(texts)
+        written = []
+        for start, end in self.batch_bounds(texts, file_paths):
+            batch_ids = write(
+                ids[start:end],
+                texts[start:end],
+                file_paths[start:end],
+                vectors[start:end],
+                start_lines[start:end],
+                end_lines[start:end],
+                modified_ats[start:end],
+            )
+            self.lexical.upsert(
+                batch_ids,
+                texts[start:end],
+                file_paths[start:end],
+                start_lines[start:end],
+                end_lines[start:end],
+                modified_ats[start:end],
+            )
+            written += list(batch_ids)
+        return written
 
-    def _create_collection(self):
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-            FieldSchema(name="file_path", dtype=DataType.VARCHAR, max_length=65535),
-            FieldSchema(name="embeddings", dtype=DataType.FLOAT_VECTOR, dim=self.dim)
-        ]
-        schema = CollectionSchema(fields)
-        collection = Collection(self.collection_name, schema)
-        
-        # Create index for vector field
-        collection.create_index(
-            field_name="embeddings",
-            index_params={"index_type": "IVF_FLAT", "metric_type": "L2", "params": {"nlist": 1024}}
+    def insert(
+        self,
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: List[int] = None,
+        end_lines: List[int] = None,
+        ids: List[int] = None,
+        modified_ats: List[int] = None,
+    ) -> List[int]:
+        """modified_ats are the modification times of the files (epoch
+        seconds), what the modified_after filter compares with"""
+        # Numbered before the rows are cut into requests, which would
+        # number every request from 0 again
+        ids = ids or make_chunk_ids(file_paths)
+        return self._write(
+            lambda ids, *row: self.backend.insert(*row[:-1], ids, row[-1]),
+            ids,
+            texts,
+            file_paths,
+            vectors,
+            start_lines,
+            end_lines,
+            modified_ats,
         )
-        return collection
-
-    def insert(self, texts: List[str], file_paths: List[str], vectors: List[List[float]]) -> List[int]:
-        collection = Collection(self.collection_name)
-        data = [texts, file_paths, vectors]
-        mr = collection.insert(data)
-        return mr.primary_keys
-
-    def search(self, query_vector: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        collection = Collection(self.collection_name)
-        collection.load()
-        
-        search_params = {
-            "metric_type": "L2",
-            "params": {"nprobe": 10}
-        }
-        
-        results = collection.search(
-            data=[query_vector],
-            anns_field="embeddings",
-            param=search_params,
-            limit=top_k,
-            output_fields=["text", "file_path"]
+
+    def upsert(
+        self,
+        ids: List[int],
+        texts: List[str],
+        file_paths: List[str],
+        vectors: List[List[float]],
+        start_lines: List[int] = None,
+        end_lines: List[int] = None,
+        modified_ats: List[int] = None,
+    ) -> List[int]:
+        """Inserts the chunks, replacing the rows with the same chunk ids"""
+        return self._write(
+            self.backend.upsert,
+            ids,
+            texts,
+            file_paths,
+            vectors,
+            start_lines,
+            end_lines,
+            modified_ats,
         )
-        
-        search_results = []
-        for hits in results:
-            for hit in hits:
-                search_results.append({
-                    "id": hit.id,
-                    "distance": hit.distance,
-                    "text": hit.entity.get('text'),
-                    "file_path": hit.entity.get('file_path')
-                })
-                
-        collection.release()
-        return search_results
-
-    def drop_collection(self):
-        """Drop the collection if it exists"""
-        if utility.has_collection(self.collection_name):
-            Collection(self.collection_name).drop()
-            return True
-        return False
\ No newline at end of file
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.backend.search(query_vector, top_k, filters)
+
+    def search_many(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """One round trip for many queries, the results are grouped per query"""
+        if not query_vectors:
+            return []
+        return self.backend.search_many(query_vectors, top_k, filters)
+
+    def search_lexical(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """BM25 over the chunk texts, per query. The hits have a score
+        (higher is better) instead of a distance."""
+        return self.lexical.search_many(queries, top_k, filters)
+
+    def get_vectors(self, ids: List[int]) -> Dict[int, List[float]]:
+        """The stored vectors of the chunks, by chunk id"""
+        return self.backend.get_vectors(list(ids))
+
+    def delete_by_paths(
+        self, file_paths: List[str], batch_size: int = 100, keep_ids: List[int] = None
+    ) -> int:
+        """Deletes the rows of the files, except the ones with the keep_ids"""
+        self.lexical.delete_by_paths(file_paths, keep_ids)
+        return self.backend.delete_by_paths(file_paths, batch_size, keep_ids)
+
+    def flush(self):
+        """Makes the written rows durable and countable"""
+        self.backend.flush()
+
+    def tune_index(self) -> bool:
+        """Rebuilds the vector index when the collection outgrew it,
+        returns whether it did. Cheap when nothing has to change."""
+        return self.backend.tune_index()
+
+    def drop_collection(self) -> bool:
+        self.lexical.reset()
+        return self.backend.drop_collection()
@@ -10,6 +10,8 @@ from jarvis.helper.models.coding_model import CodingModelSelector
 from langchain.output_parsers import JsonOutputToolsParser
 from jarvis.index_project.prompt import analyze_code_prompt
 from langchain.prompts import PromptTemplate
+from jarvis.helper.disk_cache import DiskCache
+import os
 
 
 class CodeComponent(BaseModel):
@@ -32,12 +34,41 @@ class IndexCodeAgent(BaseController):
             llm_selector_class=CodingModelSelector,
             prompt_text=analyze_code_prompt,
         )
-        self.model = CodingModelSelector().get_model()
+        model_selector = CodingModelSelector()
+        self.model = model_selector.get_model()
+        # Either 'gpt' or 'claude', the rate limits are per provider
+        self.provider = model_selector.model_type
+        self.model_name = f"{model_selector.model_type}:{model_selector.model}"
         self.base_prompt = PromptTemplate(
             template=self.prompt_text, input_variables=["code"]
         )
+        # The analysis only depends on the model, the prompt and the code,
+        # so it is shared between runs, branches and projects.
+        self.cache = DiskCache(
+            "analyses",
+            max_bytes=int(os.getenv("ANALYSIS_CACHE_MAX_MB", "256")) * 1024 * 1024,
+        )
+
+    def get_cache_key(self, content: str) -> str:
+        return DiskCache.make_key(self.model_name, self.prompt_text, content)
+
+    def get_cached_analyzes(self, content: str) -> str | None:
+        cached = self.cache.get(self.get_cache_key(content))
+        return cached.decode("utf-8") if cached is not None else None
 
     def start_indexing(self, content: str) -> str:
+        cached = self.get_cached_analyzes(content)
+        if cached is not None:
+            return cached
+
         prompt = self.base_prompt.invoke({"code": content})
         output = self.model.invoke(prompt)
+        self.cache.set(self.get_cache_key(content), output.content.encode("utf-8"))
+        return output.content
+
+    async def aanalyze(self, content: str) -> str:
+        """Always asks the model, the answer is stored in the cache"""
+        prompt = self.base_prompt.invoke({"code": content})
+        output = await self.model.ainvoke(prompt)
+        self.cache.set(self.get_cache_key(content), output.content.encode("utf-8"))
         return output.content
@@ -0,0 +1,121 @@
+import os
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from jarvis.helper.tokens import count_tokens
+from jarvis.index_project.code_structure import CodeSymbol, parse_symbols
+
+load_dotenv()
+
+# (start_line, end_line, symbol names), lines are 1-based and inclusive
+Piece = Tuple[int, int, List[str]]
+
+
+class CodeChunker:
+    """Cuts a file into chunks along its classes and methods. Small symbols
+    are packed together up to the token budget, big ones are split into their
+    members, and only members that are still too big are cut into line windows."""
+
+    def __init__(self, token_budget: Optional[int] = None):
+        self.token_budget = token_budget or int(os.getenv("CHUNK_TOKEN_BUDGET", "400"))
+
+    def chunk(self, file_path: str, content: str, summary: str = "") -> List[Dict]:
+        """The first chunk is the summary of the whole file (if there is one),
+        the others hold the code itself. Every chunk knows its path and lines."""
+        lines = content.splitlines(keepends=True)
+        chunks = []
+        if summary.strip():
+            chunks.append(
+                self.make_chunk(
+                    file_path,
+                    f"{summary.strip()}\npath: {file_path}",
+                    1,
+                    max(len(lines), 1),
+                )
+            )
+        if not lines:
+            return chunks
+
+        # Prefix sums, so the tokens of any line range are a subtraction away
+        self.line_tokens = [0] + list(accumulate(count_tokens(line) for line in lines))
+        pieces = self.split(parse_symbols(file_path, content), 1, len(lines), "")
+        for start, end, names in self.pack(pieces):
+            code = "".join(lines[start - 1 : end])
+            if not code.strip():
+                continue
+            header = f"path: {file_path}\nlines: {start}-{end}\n"
+            if names:
+                header += f"symbols: {', '.join(names)}\n"
+            chunks.append(self.make_chunk(file_path, f"{header}\n{code}", start, end))
+        return chunks
+
+    @staticmethod
+    def make_chunk(file_path: str, text: str, start_line: int, end_line: int) -> Dict:
+        return {
+            "text": text,
+            "metadata": {
+                "path": file_path,
+                "start_line": start_line,
+                "end_line": end_line,
+            },
+        }
+
+    def count_lines(self, start: int, end: int) -> int:
+        return self.line_tokens[end] - self.line_tokens[start - 1]
+
+    def split(
+        self, symbols: List[CodeSymbol], start: int, end: int, prefix: str
+    ) -> List[Piece]:
+        """Cuts the lines start..end into one piece per symbol. The lines in front
+        of a symbol (usings, fields, comments) go with it, the lines after the
+        last symbol go with the last one."""
+        symbols = [s for s in symbols if start <= s.start_line and s.end_line <= end]
+        if not symbols:
+            return self.split_lines(start, end, [prefix.rstrip(".")] if prefix else [])
+
+        segments = []
+        cursor = start
+        for index, symbol in enumerate(symbols):
+            segment_end = end if index == len(symbols) - 1 else symbol.end_line
+            segments.append((cursor, segment_end, symbol))
+            cursor = segment_end + 1
+
+        pieces = []
+        for segment_start, segment_end, symbol in segments:
+            name = prefix + symbol.name
+            if self.count_lines(segment_start, segment_end) <= self.token_budget:
+                pieces.append((segment_start, segment_end, [name]))
+            elif symbol.children:
+                pieces.extend(
+                    self.split(symbol.children, segment_start, segment_end, name + ".")
+                )
+            else:
+                pieces.extend(self.split_lines(segment_start, segment_end, [name]))
+        return pieces
+
+    def split_lines(self, start: int, end: int, names: List[str]) -> List[Piece]:
+        """The last resort for code without structure: windows of whole lines"""
+        pieces = []
+        window_start = start
+        for line in range(start, end + 1):
+            if (
+                line > window_start
+                and self.count_lines(window_start, line) > self.token_budget
+            ):
+                pieces.append((window_start, line - 1, names))
+                window_start = line
+        pieces.append((window_start, end, names))
+        return pieces
+
+    def pack(self, pieces: List[Piece]) -> List[Piece]:
+        """Merges neighbouring pieces as long as they fit the budget together"""
+        packed = []
+        for start, end, names in pieces:
+            if packed:
+                last_start, last_end, last_names = packed[-1]
+                if self.count_lines(last_start, end) <= self.token_budget:
+                    merged_names = last_names + [n for n in names if n not in last_names]
+                    packed[-1] = (last_start, end, merged_names)
+                    continue
+            packed.append((start, end, list(names)))
+        return packed
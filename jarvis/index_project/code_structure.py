@@ -0,0 +1,325 @@
+import ast
+import os
+import re
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+@dataclass
+class CodeSymbol:
+    """A class, interface, enum, method... and the lines it spans (1-based, inclusive)"""
+
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+    children: List["CodeSymbol"] = field(default_factory=list)
+    # The declaration without the body, like "public void Move(float speed)"
+    signature: str = ""
+    # The first paragraph of the docstring or of the /// comments
+    doc: str = ""
+
+
+def parse_symbols(file_path: str, content: str) -> List[CodeSymbol]:
+    """Finds the top level symbols of a file, with their members as children.
+    Unknown languages and unparsable files give an empty list."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".py":
+        return parse_python_symbols(content)
+    if extension == ".cs":
+        return parse_csharp_symbols(content)
+    return []
+
+
+def parse_python_symbols(content: str) -> List[CodeSymbol]:
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return []
+    return _python_symbols(tree.body, in_class=False)
+
+
+PYTHON_ENUM_BASES = {"Enum", "IntEnum", "StrEnum", "Flag", "IntFlag"}
+PYTHON_INTERFACE_BASES = {"ABC", "Protocol"}
+
+
+def _first_paragraph(text: str) -> str:
+    return " ".join(text.strip().split("\n\n")[0].split())
+
+
+def _python_signature(node) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    signature = f"{prefix} {node.name}({ast.unparse(node.args)})"
+    if node.returns is not None:
+        signature += f" -> {ast.unparse(node.returns)}"
+    return signature
+
+
+def _python_symbols(nodes, in_class: bool) -> List[CodeSymbol]:
+    symbols = []
+    for node in nodes:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            # The decorators belong to the symbol
+            start_line = min(
+                [node.lineno] + [decorator.lineno for decorator in node.decorator_list]
+            )
+            if isinstance(node, ast.ClassDef):
+                base_names = {ast.unparse(base).split(".")[-1] for base in node.bases}
+                if base_names & PYTHON_ENUM_BASES:
+                    kind = "enum"
+                elif base_names & PYTHON_INTERFACE_BASES:
+                    kind = "interface"
+                else:
+                    kind = "class"
+                children = _python_symbols(node.body, in_class=True)
+            else:
+                kind = "method" if in_class else "function"
+                children = []
+            symbols.append(
+                CodeSymbol(
+                    node.name,
+                    kind,
+                    start_line,
+                    node.end_lineno,
+                    children,
+                    signature=_python_signature(node),
+                    doc=_first_paragraph(ast.get_docstring(node) or ""),
+                )
+            )
+    return symbols
+
+
+# "record struct Point" and "record class Point" are records named Point
+CSHARP_TYPE = re.compile(
+    r"\b(class|interface|struct|enum|record)\s+(?:(?:class|struct)\s+)?(@?\w+)"
+)
+CSHARP_TYPE_KINDS = {"class", "interface", "struct", "enum", "record"}
+CSHARP_NAMESPACE = re.compile(r"\bnamespace\s+[\w.]+\s*$")
+# A name, maybe generic, followed by the parameter list and
+# maybe by a base constructor call or generic constraints. The type
+# parameters (nested once at most) have to end right before the '(',
+# so "IEnumerator<int> Routine<T>(...)" is Routine and not IEnumerator.
+CSHARP_METHOD = re.compile(
+    r"(@?\w+)\s*(?:<(?:[^<>()]|<[^<>()]*>)*>)?\s*\([^;]*\)"
+    r"\s*(?::\s*(?:base|this)\s*\([^;]*\))?\s*(?:where\s[^;]*)?$",
+    re.S,
+)
+CSHARP_PROPERTY = re.compile(r"(@?\w+)\s*$")
+CSHARP_KEYWORDS = {
+    "if", "else", "for", "foreach", "while", "do", "switch", "case", "try", "catch",
+    "finally", "using", "lock", "fixed", "return", "new", "get", "set", "init",
+    "add", "remove", "checked", "unchecked", "unsafe", "default", "operator",
+}
+
+
+def _strip_parentheses(text: str) -> str:
+    depth = 0
+    stripped = []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            stripped.append(char)
+    return "".join(stripped)
+
+
+CSHARP_NOISE = re.compile(
+    r'//[^\n]*|/\*.*?\*/|@"(?:""|[^"])*"|"(?:\\.|[^"\\])*"|^\s*#[^\n]*', re.S | re.M
+)
+# Attribute sections like [SerializeField] or [Header("Stats")]
+CSHARP_ATTRIBUTES = re.compile(r"^\s*\[[^\]]*\]", re.S)
+
+
+def _clean_csharp_header(header: str) -> str:
+    header = CSHARP_NOISE.sub(" ", header)
+    while True:
+        cleaned = CSHARP_ATTRIBUTES.sub("", header, count=1)
+        if cleaned == header:
+            return header.strip()
+        header = cleaned
+
+
+def _csharp_doc(header: str) -> str:
+    """The /// comments in front of a declaration, without their XML tags"""
+    comments = [
+        line.strip()[3:]
+        for line in header.splitlines()
+        if line.strip().startswith("///")
+    ]
+    text = re.sub(r"<[^>]*>", "\n\n", "\n".join(comments))
+    paragraphs = [" ".join(part.split()) for part in text.split("\n\n")]
+    return next((paragraph for paragraph in paragraphs if paragraph), "")
+
+
+def _classify_csharp_header(header: str, in_type: bool) -> Optional[tuple]:
+    """Tells what the text in front of a '{' declares: (kind, name) or None"""
+    header = _clean_csharp_header(header)
+    if CSHARP_NAMESPACE.search(header):
+        return ("namespace", None)
+
+    outside_parentheses = _strip_parentheses(header)
+    type_match = CSHARP_TYPE.search(outside_parentheses)
+    if type_match:
+        return (type_match.group(1), type_match.group(2).lstrip("@"))
+    if not in_type or "=" in outside_parentheses:
+        # Field initializers, lambdas and the like are no members
+        return None
+
+    method_match = CSHARP_METHOD.search(header)
+    if method_match and method_match.group(1) not in CSHARP_KEYWORDS:
+        return ("method", method_match.group(1).lstrip("@"))
+    property_match = CSHARP_PROPERTY.search(header)
+    if property_match and property_match.group(1) not in CSHARP_KEYWORDS:
+        return ("property", property_match.group(1).lstrip("@"))
+    return None
+
+
+# Everything the scanner has to look at, the rest of the code is skipped over
+CSHARP_TOKEN = re.compile(r"//|/\*|(?:\$@|@\$|@|\$)?\"|'|[{};#]")
+
+
+def parse_csharp_symbols(content: str) -> List[CodeSymbol]:
+    """A small scanner instead of a full parser: it follows the braces,
+    skips strings and comments, and classifies the text in front of
+    every '{' that opens a type or a member."""
+    root: List[CodeSymbol] = []
+    # Every open brace: (kind, symbol or None, children list of the scope)
+    stack = []
+    newlines = [match.start() for match in re.finditer("\n", content)]
+    header_start = 0
+    i = 0
+    length = len(content)
+
+    def line_at(position: int) -> int:
+        return bisect_left(newlines, position) + 1
+
+    def declaration_line(header: str) -> int:
+        """The first line of the header, its doc comments and attributes included"""
+        return line_at(header_start + len(header) - len(header.lstrip()))
+
+    def current_children() -> List[CodeSymbol]:
+        for kind, symbol, children in reversed(stack):
+            if kind == "namespace":
+                continue
+            return children
+        return root
+
+    def in_type_scope() -> bool:
+        for kind, symbol, children in reversed(stack):
+            if kind == "namespace":
+                continue
+            return symbol is not None and kind in CSHARP_TYPE_KINDS
+        return False
+
+    def in_code_scope() -> bool:
+        """Inside a method body or another block nothing is a symbol"""
+        for kind, symbol, children in reversed(stack):
+            if kind == "namespace":
+                continue
+            return kind not in CSHARP_TYPE_KINDS
+        return False
+
+    while True:
+        match = CSHARP_TOKEN.search(content, i)
+        if match is None:
+            break
+        token = match.group()
+        i = match.start()
+
+        if token == "//" or (
+            token == "#" and content[content.rfind("\n", 0, i) + 1 : i].strip() == ""
+        ):
+            # Comments and preprocessor directives run to the end of the line
+            end = content.find("\n", i)
+            i = length if end == -1 else end
+        elif token == "#":
+            i += 1
+        elif token == "/*":
+            end = content.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+        elif token.endswith('"'):
+            # Regular, verbatim (@) and interpolated ($) strings
+            verbatim = "@" in token
+            j = match.end()
+            while j < length:
+                if verbatim and content.startswith('""', j):
+                    j += 2
+                    continue
+                if not verbatim and content[j] == "\\":
+                    j += 2
+                    continue
+                if content[j] == '"':
+                    break
+                j += 1
+            i = j + 1
+        elif token == "'":
+            j = i + 1
+            while j < length and content[j] != "'" and content[j] != "\n":
+                j += 2 if content[j] == "\\" else 1
+            i = j + 1
+        elif token == "{":
+            header = content[header_start:i]
+            declaration = None
+            if not in_code_scope():
+                declaration = _classify_csharp_header(header, in_type_scope())
+            if declaration is None:
+                stack.append(("block", None, None))
+            elif declaration[0] == "namespace":
+                stack.append(("namespace", None, None))
+            else:
+                kind, name = declaration
+                start_line = declaration_line(header)
+                symbol = CodeSymbol(
+                    name,
+                    kind,
+                    start_line,
+                    start_line,
+                    signature=" ".join(_clean_csharp_header(header).split()),
+                    doc=_csharp_doc(header),
+                )
+                current_children().append(symbol)
+                stack.append((kind, symbol, symbol.children))
+            i += 1
+            header_start = i
+        elif token == "}":
+            if stack:
+                kind, symbol, children = stack.pop()
+                if symbol is not None:
+                    symbol.end_line = line_at(i)
+            i += 1
+            header_start = i
+        elif token == ";":
+            if not in_code_scope():
+                # Abstract and interface methods, members with an expression
+                # body like "int Count() => items.Count;" and positional
+                # records like "record Point(int X, int Y);"
+                header = content[header_start:i]
+                declaration_text, arrow, _ = header.partition("=>")
+                declaration = _classify_csharp_header(declaration_text, in_type_scope())
+                if declaration is not None and (
+                    declaration[0] in ("method", "record")
+                    or (arrow and declaration[0] == "property")
+                ):
+                    current_children().append(
+                        CodeSymbol(
+                            declaration[1],
+                            declaration[0],
+                            declaration_line(header),
+                            line_at(i),
+                            signature=" ".join(
+                                _clean_csharp_header(declaration_text).split()
+                            ),
+                            doc=_csharp_doc(header),
+                        )
+                    )
+            i += 1
+            header_start = i
+
+    return root
+
@@ -1,12 +1,20 @@
+import asyncio
 import pdb
-from typing import Dict
+import time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple
 from jarvis.codegen.service import read_file
 from jarvis.helper.cmd_dirs_to_json import parse_dir_output
 from jarvis.helper.cmd_prompt import change_dir, run_command
 from jarvis.helper.db import Database
 from jarvis.helper.embedding import EmbeddingService
+from jarvis.helper.vector_backends.base import make_chunk_id
 from jarvis.helper.vector_db import VectorDB
 from jarvis.index_project.agent import IndexCodeAgent
+from jarvis.index_project.chunker import CodeChunker
+from jarvis.index_project.manifest import IndexManifest
+from jarvis.index_project.path_matcher import PathMatcher
+from jarvis.index_project.static_analyzer import StaticAnalyzer
+from jarvis.index_project.worker_pool import AnalysisWorkerPool
 from yaml import safe_load
 import os
 
@@ -14,22 +22,24 @@ import os
 class IndexController:
 
     DIMENSIONS = 1536
-    DOCUMENT_SEPARATOR = "===============CUT==============="
+    # How many chunks are embedded and inserted at once
+    BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+    # Embedded batches waiting to be written, this bounds the memory
+    WRITE_QUEUE_SIZE = int(os.getenv("INDEX_WRITE_QUEUE_SIZE", "2"))
 
-    def __init__(self):
+    def __init__(
+        self, llm_analysis: bool = False, vector_db_class=VectorDB, db_service=None
+    ):
         self.embedding_service = EmbeddingService()
         self.index_code_agent = IndexCodeAgent()
-        self.db_service = Database()
+        # Routine files are described by the parser, unless
+        # the LLM is asked to analyze every file.
+        self.static_analyzer = StaticAnalyzer()
+        self.llm_analysis = llm_analysis
+        # The benchmarks index into in-memory stand-ins
+        self.vector_db_class = vector_db_class
+        self.db_service = db_service or Database()
         self.base_path = ""
-        self.indexed_doc = ""
-
-    def should_ignore_dir(self, dir_path: str) -> bool:
-        dir_name = os.path.basename(dir_path)
-        # Case-insensitive directory check
-        return any(
-            ignored.lower() == dir_name.lower() or ignored.lower() in dir_path.lower()
-            for ignored in self.ignored_directories
-        )
 
     # Yo, Every project has a Jarvis.yaml file
     # In which we can set the directory from which
@@ -46,6 +56,92 @@ class IndexController:
             print("The Jarvis.yaml is missing. run a 'jarvis --init .' command.")
 
     def start_indexing(self, path: str):
+        asyncio.run(self.astart_indexing(path))
+
+    async def astart_indexing(self, path: str):
+        """Streams the project through walk -> analyze -> chunk -> embed -> insert.
+        Only a few batches are in memory at any time, and the first vectors
+        are inserted while the walk is still going."""
+        path = self.prepare_indexing(path)
+        self.reset_run_state()
+
+        await self.aindex_files(self.iter_changed_files(path))
+
+        # Only now it is known which files are gone
+        self.remove_deleted_files(self.manifest.missing_paths(self.seen_paths))
+        self.finish_run()
+        print(f"Analysis cache: {self.index_code_agent.cache.stats()}")
+        print(f"Embedding cache: {self.embedding_service.stats()}")
+        self.save_collection()
+
+    async def aindex_paths(self, paths: Iterable[str]):
+        """Re-indexes only the given files or directories, the project has to be
+        prepared already. Used by the watch mode after a burst of changes."""
+        self.reset_run_state()
+        changed_paths = []
+        deleted_paths = []
+        for path in sorted(set(os.path.abspath(path) for path in paths)):
+            if os.path.isdir(path):
+                changed_paths.extend(self.iter_project_files(path))
+            elif os.path.isfile(path):
+                if self.is_included_file(path):
+                    changed_paths.append(path)
+            else:
+                # A deleted directory takes all of its files with it
+                prefix = path + os.sep
+                deleted_paths.extend(
+                    indexed_path
+                    for indexed_path in self.manifest.files
+                    if indexed_path == path or indexed_path.startswith(prefix)
+                )
+
+        # A new directory and the files in it can show up both
+        changed_paths = list(dict.fromkeys(changed_paths))
+        await self.aindex_files(self.filter_changed_files(changed_paths))
+        self.remove_deleted_files(deleted_paths)
+        if not self.changed_count and not self.deleted_paths:
+            # Like a save without changes, no manifest write and no index
+            # tuning, which would only wake the watcher up again
+            return
+        self.finish_run()
+
+    async def aindex_files(self, file_paths: Iterator[str]):
+        analyses = self.aiter_file_analyzes(file_paths)
+        chunks = self.aiter_chunks(analyses)
+        await self.aembed_and_insert(chunks)
+
+    def reset_run_state(self):
+        self.seen_paths = set()
+        # The stat and hash of the changed files which are not inserted yet
+        self.pending_files = {}
+        # The ids of the chunks upserted for every changed file so far
+        self.chunk_ids: Dict[str, List[int]] = {}
+        self.deleted_paths = []
+        self.changed_count = 0
+        self.skipped_count = 0
+        self.static_count = 0
+        self.inserted_count = 0
+        self.insert_seconds = 0.0
+
+    def finish_run(self):
+        # Only the first run into a new collection can skip the cleanup
+        self.fresh_collection = False
+        self.manifest.save()
+        if self.changed_count or self.deleted_paths:
+            # The index that fits the collection changes as it grows
+            self.vector_db.tune_index()
+        print(
+            f"{self.changed_count} files changed, {self.skipped_count} files unchanged, "
+            f"{len(self.deleted_paths)} files deleted, "
+            f"{self.static_count} files analyzed without the LLM."
+        )
+        if self.inserted_count:
+            print(
+                f"Wrote {self.inserted_count} chunks in {self.insert_seconds:.2f}s "
+                f"({self.inserted_count / max(self.insert_seconds, 1e-9):.0f} chunks/s)."
+            )
+
+    def prepare_indexing(self, path: str) -> str:
         configs = self.get_projects_config(path=path)
 
         # These are the files that will be included or excluded
@@ -53,6 +149,8 @@ class IndexController:
         self.ignored_directories = configs.get("ignored-directories")
         self.included_file_extensions = configs.get("included-file-extensions")
         starting_directory = configs.get("starting-directory")
+        self.concurrency = configs.get("indexing-concurrency")
+        self.chunker = CodeChunker(token_budget=configs.get("chunk-token-budget"))
 
         # The base path is the path of the whole
         # project, not just the "src" folder.
@@ -67,101 +165,246 @@ class IndexController:
         self.collection_name = os.path.basename(os.path.normpath(path)).replace(
             " ", "_"
         )
-        self.vector_db = VectorDB(
+        self.vector_db = self.vector_db_class(
             collection_name=self.collection_name, dim=self.DIMENSIONS
         )
 
-        # Index all the files into one string
-        self.walk_through_project(path)
-        # Chunk this string
-        self.chunk_doc()
-        # Embed and save for further RAG operations
-        self.save_collection()
+        # The manifest tells which files are already indexed
+        # and have not changed since then.
+        self.manifest = IndexManifest(
+            self.base_path, self.collection_name, self.vector_db.store_id
+        )
+        self.fresh_collection = self.vector_db.created
+        if self.vector_db.created:
+            self.manifest.reset()
 
-    def walk_through_project(self, path: str):
-        file_count = 0
-        for root, dirs, files in os.walk(path):
-            # Filter directories using case-insensitive patterns
-            dirs[:] = [
-                d for d in dirs if not self.should_ignore_dir(os.path.join(root, d))
-            ]
-
-            # Filter files based on included extensions
-            included_files = [
-                f
-                for f in files
-                if any(
-                    f.lower().endswith(ext.lower())
-                    for ext in self.included_file_extensions
-                )
-            ]
+        self.starting_path = os.path.abspath(path)
+        # The ignored directories, the .gitignore and the extensions
+        # are compiled once for the whole walk.
+        self.path_matcher = PathMatcher(
+            base_path=self.base_path,
+            starting_path=self.starting_path,
+            ignored_directories=self.ignored_directories,
+            included_file_extensions=self.included_file_extensions,
+        )
+        return path
 
-            for file in included_files:
-                self.current_path = root
-                self.current_name = file
-                self.process_file()
-                file_count += 1
-                if file_count % 3 == 0 or file_count % 4 == 0:
-                    self.indexed_doc += f"\n{self.DOCUMENT_SEPARATOR}\n"
+    def iter_project_files(self, path: str) -> Iterator[str]:
+        """Yields the included files. The walk is sorted,
+        which keeps the chunks reproducible between runs."""
+        return self.path_matcher.iter_files(path)
 
-    def save_collection(self):
-        """Create a collection if it doesn't exist, otherwise return existing one"""
-        existing_collection = self.db_service.get_collection_by_path(self.base_path)
-        if existing_collection:
-            return existing_collection
+    def is_included_file(self, file_path: str) -> bool:
+        """Whether a single file would have been yielded by the walk"""
+        return self.path_matcher.is_included(file_path)
 
-        return self.db_service.create_project_collection(
-            name=self.collection_name, path=self.base_path
-        )
+    def is_watched_path(self, path: str, is_dir: bool) -> bool:
+        """Whether the watch mode has to re-index after a change of the path"""
+        return self.path_matcher.is_watched(path, is_dir)
+
+    def iter_changed_files(self, path: str) -> Iterator[str]:
+        return self.filter_changed_files(self.iter_project_files(path))
 
-    def process_file(self) -> None:
+    def filter_changed_files(self, file_paths: Iterable[str]) -> Iterator[str]:
+        for file_path in file_paths:
+            if self.needs_indexing(file_path):
+                self.changed_count += 1
+                yield file_path
+            else:
+                self.skipped_count += 1
+
+    def needs_indexing(self, abs_path: str) -> bool:
+        """Checks the file against the manifest. Only new and changed
+        files have to go through the LLM again. A file that vanished since
+        the walk, or can't be read, is skipped. Left out of seen_paths, its
+        rows go like the ones of a deleted file."""
         try:
-            content = self.open_file()
-            file_analyzes = self.index_code_agent.start_indexing(content)
-            abs_path = os.path.abspath(
-                os.path.join(self.current_path, self.current_name)
-            )
-            file_analyzes = file_analyzes + f"\npath: {abs_path}"
-            self.indexed_doc += f"{file_analyzes}\n"
+            stat = os.stat(abs_path)
+            if self.manifest.is_unchanged(abs_path, stat):
+                self.seen_paths.add(abs_path)
+                return False
+
+            with open(abs_path, "rb") as file:
+                content_hash = IndexManifest.hash_content(file.read())
+        except (FileNotFoundError, PermissionError) as e:
+            print(f"Skipping file {abs_path}: {str(e)}")
+            return False
+        self.seen_paths.add(abs_path)
+
+        # The file was only touched, the content is the same
+        if self.manifest.has_same_hash(abs_path, content_hash):
+            self.manifest.update(abs_path, stat, content_hash)
+            return False
+
+        self.pending_files[abs_path] = (stat, content_hash)
+        return True
+
+    async def aiter_file_analyzes(
+        self, file_paths: Iterator[str]
+    ) -> AsyncIterator[Tuple[str, str, str]]:
+        self.pool = AnalysisWorkerPool(
+            provider=self.index_code_agent.provider, concurrency=self.concurrency
+        )
+        async for file_path, result in self.pool.imap(self.aprocess_file, file_paths):
+            if isinstance(result, Exception):
+                # The file stays out of the manifest and is retried next run
+                print(f"Error processing file {file_path}: {str(result)}")
+                self.pending_files.pop(file_path, None)
+                continue
+            content, file_analyzes = result
             print(file_analyzes)
-            return file_analyzes
-        except Exception as e:
-            print(f"Error processing file {self.current_name}: {str(e)}")
+            yield file_path, content, file_analyzes
+
+    async def aiter_chunks(
+        self, analyses: AsyncIterator[Tuple[str, str, str]]
+    ) -> AsyncIterator[Dict]:
+        async for file_path, content, file_analyzes in analyses:
+            chunks = self.chunk_file_analyzes(file_path, content, file_analyzes)
+            if not chunks:
+                # An empty file, there is nothing to insert
+                # but maybe the rows of what it was before.
+                if self.manifest.get(file_path):
+                    await asyncio.to_thread(self.vector_db.delete_by_paths, [file_path])
+                stat, content_hash = self.pending_files.pop(file_path)
+                self.manifest.update(file_path, stat, content_hash)
+                continue
+            # The file counts as indexed once its last chunk is inserted
+            chunks[-1]["last_of_file"] = True
+            # What the modified_after filter of the search compares with
+            modified_at = int(self.pending_files[file_path][0].st_mtime)
+            for position, chunk in enumerate(chunks):
+                chunk["id"] = make_chunk_id(file_path, position)
+                chunk["metadata"]["modified_at"] = modified_at
+                yield chunk
 
-    def chunk_doc(self):
-        if not self.indexed_doc:
-            return []
+    def chunk_file_analyzes(
+        self, file_path: str, content: str, file_analyzes: str
+    ) -> List[Dict]:
+        # The chunks never span files, so that the vectors
+        # of a file can be removed once it changes.
+        return self.chunker.chunk(file_path, content, summary=file_analyzes)
 
-        documents = self.indexed_doc.split(self.DOCUMENT_SEPARATOR)
-        chunks = [doc.strip() for doc in documents if doc.strip()]
+    async def aembed_and_insert(self, chunks: AsyncIterator[Dict]):
+        """Embeds the next batch while the last one is written. The writer
+        takes the batches in order, at most WRITE_QUEUE_SIZE are waiting."""
+        queue = asyncio.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+        writer = asyncio.create_task(self.awrite_batches(queue))
+        try:
+            batch = []
+            async for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= self.BATCH_SIZE:
+                    await self.aqueue_batch(queue, writer, batch)
+                    batch = []
+            if batch:
+                await self.aqueue_batch(queue, writer, batch)
+            await self.aqueue_batch(queue, writer, None)
+            await writer
+        finally:
+            if not writer.done():
+                writer.cancel()
+                await asyncio.gather(writer, return_exceptions=True)
 
-        embeddings_input = []
-        for chunk in chunks:
-            metadata = {}
-            path_line = [
-                line for line in chunk.split("\n") if line.startswith("path: ")
-            ]
-            if path_line:
-                metadata["path"] = path_line[0].replace("path: ", "")
-            embeddings_input.append({"text": chunk, "metadata": metadata})
+    async def aqueue_batch(self, queue: asyncio.Queue, writer: asyncio.Task, batch):
+        if batch is not None:
+            batch = await self.embedding_service.aembed_chunks(batch)
+        put = asyncio.ensure_future(queue.put(batch))
+        await asyncio.wait({put, writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            # The writer failed and won't take anything anymore
+            put.cancel()
+            writer.result()
 
-        # Get embeddings and store in vector DB
-        embedded_chunks = self.embedding_service.embed_chunks(embeddings_input)
+    async def awrite_batches(self, queue: asyncio.Queue):
+        while (batch := await queue.get()) is not None:
+            await self.ainsert_batch(batch)
 
+    async def ainsert_batch(self, embedded_chunks: List[Dict]):
+        started = time.perf_counter()
+        ids = [chunk["id"] for chunk in embedded_chunks]
         texts = [chunk["text"] for chunk in embedded_chunks]
         vectors = [chunk["embedding"] for chunk in embedded_chunks]
         paths = [chunk["metadata"]["path"] for chunk in embedded_chunks]
+        start_lines = [chunk["metadata"]["start_line"] for chunk in embedded_chunks]
+        end_lines = [chunk["metadata"]["end_line"] for chunk in embedded_chunks]
+        modified_ats = [chunk["metadata"]["modified_at"] for chunk in embedded_chunks]
+
+        # The chunk ids are stable, so the rows of a changed file are replaced
+        # in place. The Milvus client blocks, keep the analyses running meanwhile.
+        await asyncio.to_thread(
+            self.vector_db.upsert,
+            ids=ids,
+            texts=texts,
+            file_paths=paths,
+            vectors=vectors,
+            start_lines=start_lines,
+            end_lines=end_lines,
+            modified_ats=modified_ats,
+        )
+        for path, id in zip(paths, ids):
+            self.chunk_ids.setdefault(path, []).append(id)
+
+        finished_paths = [
+            chunk["metadata"]["path"]
+            for chunk in embedded_chunks
+            if chunk.get("last_of_file")
+        ]
+        # A file that got shorter leaves rows behind, which go now
+        if finished_paths and not self.fresh_collection:
+            keep_ids = [id for path in finished_paths for id in self.chunk_ids[path]]
+            await asyncio.to_thread(
+                self.vector_db.delete_by_paths, finished_paths, keep_ids=keep_ids
+            )
+
+        # Remember what has been indexed, so an interrupted
+        # run continues where it stopped.
+        for path in finished_paths:
+            stat, content_hash = self.pending_files.pop(path)
+            self.manifest.update(path, stat, content_hash)
+            del self.chunk_ids[path]
+        self.manifest.save()
+        self.inserted_count += len(texts)
+        self.insert_seconds += time.perf_counter() - started
+        print(f"Inserted {len(texts)} chunks.")
+
+    def remove_deleted_files(self, deleted_paths: List[str]):
+        self.deleted_paths = deleted_paths
+        if not self.deleted_paths:
+            return
+        deleted = self.vector_db.delete_by_paths(self.deleted_paths)
+        for path in self.deleted_paths:
+            self.manifest.remove(path)
+        print(f"Removed {deleted} vectors of {len(self.deleted_paths)} deleted files.")
+
+    def save_collection(self):
+        """Create a collection if it doesn't exist, otherwise return existing one"""
+        existing_collection = self.db_service.get_collection_by_path(self.base_path)
+        if existing_collection:
+            return existing_collection
+
+        return self.db_service.create_project_collection(
+            name=self.collection_name, path=self.base_path
+        )
 
-        # Store in vector DB
-        self.vector_db.insert(texts=texts, file_paths=paths, vectors=vectors)
+    async def aprocess_file(self, file_path: str) -> Tuple[str, str]:
+        """Returns the content of the file and its analysis"""
+        content = self.open_file(file_path)
+        if not self.llm_analysis:
+            analyses = self.static_analyzer.analyze(file_path, content)
+            if analyses is not None:
+                self.static_count += 1
+                return content, analyses
 
-        return embedded_chunks
+        # Cached analyses skip the pool and its rate limit
+        cached = self.index_code_agent.get_cached_analyzes(content)
+        if cached is not None:
+            return content, cached
+        return content, await self.pool.run(self.index_code_agent.aanalyze, content)
 
-    def open_file(self) -> str:
+    def open_file(self, file_path: str) -> str:
         try:
-            file_path = os.path.join(self.current_path, self.current_name)
             with open(file_path, "r", encoding="utf-8") as file:
                 return file.read()
         except Exception as e:
-            print(f"Error reading file {self.current_name}: {str(e)}")
+            print(f"Error reading file {file_path}: {str(e)}")
             raise
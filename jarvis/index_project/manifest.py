@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+
+class IndexManifest:
+    """Remembers the path, mtime, size and content hash of every indexed file,
+    so that a re-index only has to touch the files that actually changed.
+    It only holds for the store it was written for (store_id), a vector
+    store that was lost and created again needs everything again."""
+
+    DIRECTORY = ".jarvis"
+    FILE_NAME = "index_manifest.json"
+
+    def __init__(self, base_path: str, collection_name: str, store_id: str = ""):
+        self.path = os.path.join(base_path, self.DIRECTORY, self.FILE_NAME)
+        self.collection_name = collection_name
+        self.store_id = store_id
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                content = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"The index manifest is unreadable, indexing from scratch: {str(e)}")
+            return
+
+        # A manifest written for another collection, or another copy of
+        # this one, says nothing about what is stored in it now.
+        if content.get("collection") != self.collection_name:
+            return
+        if content.get("store_id") != self.store_id:
+            print("The vector store changed since the last index, indexing from scratch.")
+            return
+        self.files = content.get("files", {})
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "collection": self.collection_name,
+                    "store_id": self.store_id,
+                    "files": self.files,
+                },
+                file,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+
+    def reset(self) -> None:
+        self.files = {}
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def is_unchanged(self, file_path: str, stat: os.stat_result) -> bool:
+        """Cheap check that only looks at the stat result"""
+        entry = self.files.get(file_path)
+        return (
+            entry is not None
+            and entry["mtime"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        )
+
+    def has_same_hash(self, file_path: str, content_hash: str) -> bool:
+        entry = self.files.get(file_path)
+        return entry is not None and entry["hash"] == content_hash
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(file_path)
+
+    def update(self, file_path: str, stat: os.stat_result, content_hash: str) -> None:
+        self.files[file_path] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": content_hash,
+        }
+
+    def remove(self, file_path: str) -> None:
+        self.files.pop(file_path, None)
+
+    def missing_paths(self, seen_paths) -> List[str]:
+        """Paths that were indexed before but were not seen during this walk"""
+        return [path for path in self.files if path not in seen_paths]
@@ -0,0 +1,238 @@
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+def glob_to_regex(pattern: str) -> Tuple[Optional[str], bool, bool]:
+    """Translates one gitignore line into a regex over '/' separated relative paths.
+    Returns (regex, negated, directory_only); regex is None for blank lines and comments."""
+    pattern = pattern.rstrip("\n\r")
+    # Trailing spaces are ignored unless they are escaped
+    while pattern.endswith(" ") and not pattern.endswith("\\ "):
+        pattern = pattern[:-1]
+    if not pattern or pattern.startswith("#"):
+        return None, False, False
+
+    negated = pattern.startswith("!")
+    if negated or pattern.startswith("\\!") or pattern.startswith("\\#"):
+        pattern = pattern[1:]
+
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    if not pattern:
+        return None, False, False
+
+    # A slash at the start or in the middle anchors the pattern to the root,
+    # otherwise it matches a name at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 2 if pattern[i + 1 : i + 2] in "!^" else i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                content = pattern[i + 1 : end]
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                regex += f"[{content}]"
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(char)
+        i += 1
+
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return regex, negated, directory_only
+
+
+class IgnoreRules:
+    """A list of gitignore patterns compiled into a single regex.
+    The last matching pattern wins, like in git."""
+
+    def __init__(self, patterns: Iterable[str], ignore_case: bool = False):
+        alternatives = []
+        self.negated_groups = set()
+        self.directory_only_groups = set()
+        for index, pattern in enumerate(patterns):
+            regex, negated, directory_only = glob_to_regex(pattern)
+            if regex is None:
+                continue
+            group = f"r{index}"
+            alternatives.append(f"(?P<{group}>{regex})")
+            if negated:
+                self.negated_groups.add(group)
+            if directory_only:
+                self.directory_only_groups.add(group)
+
+        self.regex = None
+        self.file_regex = None
+        if alternatives:
+            flags = re.IGNORECASE if ignore_case else 0
+            # The alternatives are tried in order, so the last pattern goes first
+            self.regex = re.compile("|".join(reversed(alternatives)), flags)
+            file_alternatives = [
+                alternative
+                for alternative in alternatives
+                if alternative[4 : alternative.index(">")]
+                not in self.directory_only_groups
+            ]
+            if file_alternatives:
+                self.file_regex = re.compile(
+                    "|".join(reversed(file_alternatives)), flags
+                )
+
+    def is_ignored(self, relative_path: str, is_dir: bool) -> bool:
+        regex = self.regex if is_dir else self.file_regex
+        if regex is None:
+            return False
+        match = regex.fullmatch(relative_path)
+        return match is not None and match.lastgroup not in self.negated_groups
+
+
+class PathMatcher:
+    """Decides which directories are walked and which files are indexed.
+    The ignored-directories of Jarvis.yaml (relative to the starting directory)
+    and the project's .gitignore (relative to the project) are compiled once."""
+
+    # Never worth indexing, whatever the configs say
+    DEFAULT_IGNORES = [".git/", ".jarvis/"]
+
+    def __init__(
+        self,
+        base_path: str,
+        starting_path: str,
+        ignored_directories: Optional[List[str]],
+        included_file_extensions: List[str],
+    ):
+        self.base_path = os.path.abspath(base_path)
+        self.starting_path = os.path.abspath(starting_path)
+
+        # The starting directory seen from the project, like "Assets/"
+        start_prefix = os.path.relpath(self.starting_path, self.base_path)
+        self.start_prefix = (
+            "" if start_prefix == "." else start_prefix.replace(os.sep, "/") + "/"
+        )
+
+        # The entries of Jarvis.yaml are directories and,
+        # as before, are compared ignoring the case.
+        self.jarvis_rules = IgnoreRules(
+            self.DEFAULT_IGNORES
+            + [f"{entry.rstrip('/')}/" for entry in ignored_directories or []],
+            ignore_case=True,
+        )
+        self.gitignore_rules = IgnoreRules(
+            self.read_gitignore(), ignore_case=os.name == "nt"
+        )
+        self.extensions = tuple(ext.lower() for ext in included_file_extensions)
+
+    def read_gitignore(self) -> List[str]:
+        try:
+            with open(
+                os.path.join(self.base_path, ".gitignore"), "r", encoding="utf-8"
+            ) as file:
+                return file.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def is_ignored(self, relative_path: str, is_dir: bool) -> bool:
+        """relative_path is relative to the starting directory, '/' separated"""
+        return self.jarvis_rules.is_ignored(
+            relative_path, is_dir
+        ) or self.gitignore_rules.is_ignored(self.start_prefix + relative_path, is_dir)
+
+    def is_included_name(self, name: str) -> bool:
+        return name.lower().endswith(self.extensions)
+
+    def is_included(self, file_path: str) -> bool:
+        """Whether a single file would be yielded by iter_files"""
+        relative_path = os.path.relpath(os.path.abspath(file_path), self.starting_path)
+        if relative_path.startswith(".."):
+            return False
+        parts = relative_path.replace(os.sep, "/").split("/")
+        if not self.is_included_name(parts[-1]):
+            return False
+
+        # A file inside an ignored directory is never walked
+        if self.is_inside_ignored(parts[:-1]):
+            return False
+        return not self.is_ignored("/".join(parts), is_dir=False)
+
+    def is_watched(self, path: str, is_dir: bool) -> bool:
+        """Whether a change of the file or directory can matter to the index"""
+        if not is_dir:
+            return self.is_included(path)
+        relative_path = os.path.relpath(os.path.abspath(path), self.starting_path)
+        if relative_path.startswith(".."):
+            return False
+        if relative_path == ".":
+            return True
+        return not self.is_inside_ignored(relative_path.replace(os.sep, "/").split("/"))
+
+    def is_inside_ignored(self, directory_parts: List[str]) -> bool:
+        """Whether the directory, or one of its parents, is ignored"""
+        return any(
+            self.is_ignored("/".join(directory_parts[:i]), is_dir=True)
+            for i in range(1, len(directory_parts) + 1)
+        )
+
+    def iter_files(self, path: Optional[str] = None) -> Iterator[str]:
+        """Walks from path (the starting directory by default) with os.scandir,
+        without descending into ignored directories. The order is sorted,
+        so the walk is reproducible."""
+        path = os.path.abspath(path or self.starting_path)
+        relative_root = os.path.relpath(path, self.starting_path)
+        relative_root = (
+            "" if relative_root == "." else relative_root.replace(os.sep, "/") + "/"
+        )
+        # Walking from inside an ignored directory, like the watch mode does
+        # for a new directory, must not bring back what the rules drop
+        root_parts = relative_root.rstrip("/").split("/") if relative_root else []
+        if root_parts[:1] == [".."] or self.is_inside_ignored(root_parts):
+            return
+
+        stack = [(path, relative_root)]
+        while stack:
+            directory, relative_directory = stack.pop()
+            try:
+                with os.scandir(directory) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"Error reading directory {directory}: {str(e)}")
+                continue
+
+            subdirectories = []
+            for entry in entries:
+                relative_path = relative_directory + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.is_ignored(relative_path, is_dir=True):
+                        subdirectories.append((entry.path, relative_path + "/"))
+                elif self.is_included_name(entry.name) and not self.is_ignored(
+                    relative_path, is_dir=False
+                ):
+                    yield entry.path
+
+            stack.extend(reversed(subdirectories))
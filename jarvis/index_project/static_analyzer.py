@@ -0,0 +1,60 @@
+import os
+from typing import List, Optional
+from dotenv import load_dotenv
+from jarvis.index_project.code_structure import CodeSymbol, parse_symbols
+
+load_dotenv()
+
+
+class StaticAnalyzer:
+    """Describes the classes, interfaces and enums of a file straight from the
+    parser, in the same "name / type / description" format the LLM answers
+    with. Files it can't describe well enough are left to the LLM."""
+
+    # The kinds analyze_code_prompt asks for, plus module level functions
+    COMPONENT_KINDS = {"class", "interface", "struct", "enum", "record", "function"}
+
+    def __init__(self, max_lines: Optional[int] = None, max_members: Optional[int] = None):
+        # Beyond this a file is too complex to be summed up by its signatures
+        self.max_lines = max_lines or int(os.getenv("STATIC_ANALYSIS_MAX_LINES", "400"))
+        self.max_members = max_members or int(
+            os.getenv("STATIC_ANALYSIS_MAX_MEMBERS", "30")
+        )
+
+    def analyze(self, file_path: str, content: str) -> Optional[str]:
+        """Returns the analysis, or None when the LLM has to do it"""
+        if content.count("\n") + 1 > self.max_lines:
+            return None
+
+        components = self.find_components(parse_symbols(file_path, content))
+        if not components:
+            # Unknown languages, syntax errors and plain scripts
+            return None
+        if any(len(component.children) > self.max_members for component in components):
+            return None
+
+        return "\n\n".join(self.describe(component) for component in components)
+
+    def find_components(self, symbols: List[CodeSymbol]) -> List[CodeSymbol]:
+        """The types at any depth (nested classes included) and the top level functions"""
+        components = []
+        for symbol in symbols:
+            if symbol.kind in self.COMPONENT_KINDS:
+                components.append(symbol)
+            components.extend(self.find_components(symbol.children))
+        return components
+
+    def describe(self, component: CodeSymbol) -> str:
+        description = f"Declared as `{component.signature}`."
+        if component.doc:
+            doc = component.doc if component.doc.endswith(".") else component.doc + "."
+            description = f"{doc} {description}"
+
+        methods = [c.signature for c in component.children if c.kind == "method"]
+        properties = [c.name for c in component.children if c.kind == "property"]
+        if methods:
+            description += f" Methods: {'; '.join(methods)}."
+        if properties:
+            description += f" Properties: {', '.join(properties)}."
+
+        return f"name: {component.name},\ntype: {component.kind},\ndescription: {description},"
@@ -0,0 +1,142 @@
+import asyncio
+import os
+from typing import Callable, Dict, Set, Tuple
+from dotenv import load_dotenv
+from jarvis.index_project.controller import IndexController
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # Without watchdog the watcher polls the project instead
+    FileSystemEventHandler = object
+    Observer = None
+
+load_dotenv()
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Hands the paths of the filesystem events over to the event loop.
+    watchdog calls it from its own thread. Only the paths the index cares
+    about get through, the writes of the indexer itself (the manifest in
+    .jarvis/) would start the next run otherwise."""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue,
+        is_watched: Callable[[str, bool], bool],
+    ):
+        self.loop = loop
+        self.queue = queue
+        self.is_watched = is_watched
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        # Saving a file also modifies its directory, the file event is enough
+        if event.is_directory and event.event_type == "modified":
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        for path in paths:
+            if path and self.is_watched(path, event.is_directory):
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, path)
+
+
+class ProjectWatcher:
+    """Keeps the index of a project fresh. It watches the starting directory
+    (inotify, ReadDirectoryChangesW or FSEvents through watchdog, polling
+    otherwise), waits until a burst of saves is over and re-indexes only
+    the touched files."""
+
+    def __init__(
+        self,
+        index_controller: IndexController,
+        debounce_seconds: float | None = None,
+        poll_seconds: float | None = None,
+    ):
+        self.index_controller = index_controller
+        self.debounce_seconds = debounce_seconds or float(
+            os.getenv("WATCH_DEBOUNCE_SECONDS", "1.0")
+        )
+        self.poll_seconds = poll_seconds or float(os.getenv("WATCH_POLL_SECONDS", "2.0"))
+
+    async def watch(self, path: str):
+        # Catch up with whatever changed while nobody was watching
+        await self.index_controller.astart_indexing(path)
+        starting_path = self.index_controller.starting_path
+
+        queue: asyncio.Queue = asyncio.Queue()
+        observer = self.start_observer(starting_path, queue)
+        poller = None
+        if observer is None:
+            poller = asyncio.create_task(self.poll(starting_path, queue))
+
+        print(f"Watching {starting_path} for changes. Press Ctrl+C to stop.")
+        try:
+            while True:
+                changed_paths = await self.collect_burst(queue)
+                print(f"Re-indexing {len(changed_paths)} changed paths...")
+                try:
+                    await self.index_controller.aindex_paths(changed_paths)
+                except Exception as e:
+                    # A failed run must not end the watch, the manifest
+                    # makes the next run pick the files up again.
+                    print(f"Error re-indexing: {str(e)}")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if poller is not None:
+                poller.cancel()
+
+    def start_observer(self, path: str, queue: asyncio.Queue):
+        if Observer is None:
+            print("watchdog is not installed, polling the project instead.")
+            return None
+        try:
+            observer = Observer()
+            handler = _ChangeHandler(
+                asyncio.get_running_loop(), queue, self.index_controller.is_watched_path
+            )
+            observer.schedule(handler, path, recursive=True)
+            observer.start()
+            return observer
+        except OSError as e:
+            # For example when the inotify watch limit is reached
+            print(f"Could not watch the project, polling instead: {str(e)}")
+            return None
+
+    async def collect_burst(self, queue: asyncio.Queue) -> Set[str]:
+        """Waits for the first change, then keeps collecting
+        until nothing changed for the debounce time."""
+        changed_paths = {await queue.get()}
+        while True:
+            try:
+                changed_paths.add(
+                    await asyncio.wait_for(queue.get(), timeout=self.debounce_seconds)
+                )
+            except asyncio.TimeoutError:
+                return changed_paths
+
+    async def poll(self, path: str, queue: asyncio.Queue):
+        """The fallback: compares the mtime and size of the included
+        files every few seconds."""
+        snapshot = await asyncio.to_thread(self.take_snapshot, path)
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            new_snapshot = await asyncio.to_thread(self.take_snapshot, path)
+            for file_path in snapshot.keys() | new_snapshot.keys():
+                if snapshot.get(file_path) != new_snapshot.get(file_path):
+                    queue.put_nowait(file_path)
+            snapshot = new_snapshot
+
+    def take_snapshot(self, path: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for file_path in self.index_controller.iter_project_files(path):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import random
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Tuple,
+)
+
+import anthropic
+import openai
+from dotenv import load_dotenv
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+load_dotenv()
+
+# The rate limiters are shared by every pool in the process,
+# because the provider limit is per API key, not per pool.
+_rate_limiters: Dict[str, InMemoryRateLimiter] = {}
+
+
+def get_rate_limiter(provider: str) -> InMemoryRateLimiter:
+    """Get the process wide rate limiter of a provider ('gpt' or 'claude').
+    The limit is read from GPT_REQUESTS_PER_SECOND / CLAUDE_REQUESTS_PER_SECOND."""
+    provider = provider.lower()
+    if provider not in _rate_limiters:
+        requests_per_second = float(
+            os.getenv(f"{provider.upper()}_REQUESTS_PER_SECOND", "5")
+        )
+        _rate_limiters[provider] = InMemoryRateLimiter(
+            requests_per_second=requests_per_second,
+            check_every_n_seconds=0.05,
+            max_bucket_size=max(1, int(requests_per_second)),
+        )
+    return _rate_limiters[provider]
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits (429), server errors (5xx) and dropped connections are
+    worth another try, everything else is a real failure."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+
+    return isinstance(
+        error,
+        (
+            openai.APIConnectionError,
+            anthropic.APIConnectionError,
+            asyncio.TimeoutError,
+            ConnectionError,
+        ),
+    )
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AnalysisWorkerPool:
+    """Runs coroutines concurrently with a bounded number of workers,
+    a per provider rate limit and retries on 429/5xx."""
+
+    def __init__(
+        self,
+        provider: str,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.concurrency = concurrency or int(os.getenv("INDEX_CONCURRENCY", "8"))
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.getenv("INDEX_MAX_RETRIES", "5"))
+        )
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = get_rate_limiter(provider)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def run(self, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run one call inside the pool, retrying it if the provider asks for it"""
+        async with self.semaphore:
+            attempt = 0
+            while True:
+                await self.rate_limiter.aacquire()
+                try:
+                    return await func(*args)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    delay = get_retry_after(e) or min(
+                        self.max_delay, self.base_delay * 2**attempt
+                    )
+                    # The jitter keeps the workers from retrying in lockstep
+                    delay += random.uniform(0, delay / 2)
+                    attempt += 1
+                    print(
+                        f"Retrying in {delay:.1f}s ({attempt}/{self.max_retries}): {str(e)}"
+                    )
+                    await asyncio.sleep(delay)
+
+    async def imap(
+        self, func: Callable[[Any], Awaitable[Any]], items: Iterable[Any]
+    ) -> AsyncIterator[Tuple[Any, Any]]:
+        """Run func for every item. The items are pulled lazily and every
+        (item, result) is yielded as soon as it is ready, in the order of the
+        items. A failed item gets its exception in place of the result.
+        At most twice the concurrency items are in flight, which keeps the
+        memory bounded no matter how many items there are.
+
+        func is not limited by the pool itself, so it can skip
+        the provider for cheap work and wrap only its model calls in run."""
+        iterator = iter(items)
+        window = deque()
+        max_in_flight = self.concurrency * 2
+
+        def fill_window():
+            while len(window) < max_in_flight:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                window.append((item, asyncio.ensure_future(func(item))))
+
+        try:
+            fill_window()
+            while window:
+                item, task = window.popleft()
+                try:
+                    result = await task
+                except Exception as e:
+                    result = e
+                fill_window()
+                yield item, result
+        finally:
+            # The consumer stopped early, nobody waits for the rest
+            for _, task in window:
+                task.cancel()
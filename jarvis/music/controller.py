@@ -6,7 +6,7 @@ from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import tool
 from jarvis.helper.base_controller import BaseController
-from jarvis.helper.db import Database, Role
+from jarvis.helper.db import Database
 from jarvis.helper.models.music_model import MusicModelSelector
 from jarvis.helper.string_to_dict import string_to_dict
 from jarvis.music.prompts import get_music_agent_prompt
@@ -96,11 +96,7 @@ class MusicController(BaseController):
             )
 
             output = string_to_dict(result["output"])
-            session = self.db.create_session(path=output.get("path"))
-            self.db.add_message(session_id=session.id, content=input, role=Role.HUMAN)
-            self.db.add_message(
-                session_id=session.id, content=output.get("content"), role=Role.AI
-            )
+            self.db.record_exchange(input, output.get("content"), path=output.get("path"))
 
             return output  # Direct output from the tool
 
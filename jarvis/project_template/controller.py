@@ -2,7 +2,7 @@ import json
 from typing import Any, Dict
 from jarvis.git.service import create_and_push_repo
 from jarvis.helper.base_controller import BaseController
-from jarvis.helper.db import Database, Role
+from jarvis.helper.db import Database
 from jarvis.helper.models.coding_model import CodingModelSelector
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.agents import AgentExecutor, create_tool_calling_agent
@@ -43,10 +43,8 @@ class ProjectTempController(BaseController):
 
         # Store the Human input and AI output into a session,
         # related to this specific project
-        session = self.db.create_session(path=output.get("path_to_project"))
-        self.db.add_message(session_id=session.id, content=input, role=Role.HUMAN)
-        self.db.add_message(
-            session_id=session.id, content=output.get("content"), role=Role.AI
+        self.db.record_exchange(
+            input, output.get("content"), path=output.get("path_to_project")
         )
 
         return output
@@ -10,7 +10,10 @@ untiy_jarvis_file = """
 starting-directory: Assets
 
 # This is the folders which it
-# will totally ignore.
+# will totally ignore. They are gitignore
+# style globs relative to the starting
+# directory, like "Plugins" or "Art/**/Generated".
+# The project's .gitignore is applied as well.
 # Totally remove if not needed
 ignored-directories:
   - StarterAssets # This is just an example
@@ -23,4 +26,13 @@ ignored-directories:
 # The file extensions the will be read
 included-file-extensions:
   - .cs
+
+# How many files are analyzed at the same time.
+# Falls back to INDEX_CONCURRENCY from the .env file
+# indexing-concurrency: 8
+
+# How many tokens a chunk of code may have. Classes and methods
+# are kept together as long as they fit.
+# Falls back to CHUNK_TOKEN_BUDGET from the .env file
+# chunk-token-budget: 400
 """
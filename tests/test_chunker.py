@@ -0,0 +1,87 @@
+from jarvis.helper.tokens import count_tokens
+from jarvis.index_project.chunker import CodeChunker
+
+
+def make_method(name: str, body_lines: int) -> str:
+    body = "".join(
+        f"        int value{line} = {line} * speed + offset;\n" for line in range(body_lines)
+    )
+    return f"    public void {name}()\n    {{\n{body}    }}\n"
+
+
+def make_class(*methods: str) -> str:
+    return "using UnityEngine;\n\npublic class Player\n{\n" + "\n".join(methods) + "}\n"
+
+
+def code_of(chunk) -> str:
+    """The code of a chunk, without its header"""
+    return chunk["text"].split("\n\n", 1)[1]
+
+
+def lines_of(chunk):
+    return chunk["metadata"]["start_line"], chunk["metadata"]["end_line"]
+
+
+def test_summary_chunk_comes_first():
+    content = make_class(make_method("Jump", 2))
+    chunks = CodeChunker(token_budget=400).chunk("Player.cs", content, "Moves the player.")
+
+    assert chunks[0]["text"] == "Moves the player.\npath: Player.cs"
+    assert lines_of(chunks[0]) == (1, len(content.splitlines()))
+    assert len(chunks) == 2
+    assert chunks[1]["text"].startswith("path: Player.cs\nlines: 1-10\nsymbols: Player\n")
+    assert code_of(chunks[1]) == content
+
+
+def test_no_summary_chunk_without_a_summary():
+    chunks = CodeChunker(token_budget=400).chunk("Player.cs", make_class(), "  ")
+    assert [lines_of(chunk) for chunk in chunks] == [(1, 5)]
+
+
+def test_chunks_stay_within_the_token_budget():
+    content = make_class(*(make_method(f"Step{index}", 4) for index in range(8)))
+    budget = count_tokens(make_method("Step0", 4)) * 3
+    chunks = CodeChunker(token_budget=budget).chunk("Player.cs", content)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert count_tokens(code_of(chunk)) <= budget
+    # Together the chunks hold every line once, in order
+    assert "".join(code_of(chunk) for chunk in chunks) == content
+    # The members are packed, not cut apart
+    assert all(chunk["text"].split("\n")[2].startswith("symbols: Player.Step") for chunk in chunks)
+
+
+def test_oversized_function_is_split_into_line_windows():
+    method = make_method("Update", 60)
+    content = make_class(method)
+    budget = count_tokens(method) // 4
+    chunks = CodeChunker(token_budget=budget).chunk("Player.cs", content)
+
+    assert len(chunks) >= 4
+    for chunk in chunks:
+        assert count_tokens(code_of(chunk)) <= budget
+        assert "symbols: Player.Update\n" in chunk["text"]
+    assert "".join(code_of(chunk) for chunk in chunks) == content
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert lines_of(chunk)[0] == lines_of(previous)[1] + 1
+
+
+def test_file_without_symbols():
+    content = "".join(f"line {line} of the notes\n" for line in range(40))
+    budget = count_tokens(content) // 3
+    chunks = CodeChunker(token_budget=budget).chunk("notes.txt", content)
+
+    assert len(chunks) >= 3
+    for chunk in chunks:
+        assert count_tokens(code_of(chunk)) <= budget
+        assert "symbols:" not in chunk["text"]
+    assert lines_of(chunks[0])[0] == 1
+    assert lines_of(chunks[-1])[1] == 40
+    assert "".join(code_of(chunk) for chunk in chunks) == content
+
+
+def test_empty_file():
+    chunker = CodeChunker(token_budget=400)
+    assert chunker.chunk("Empty.cs", "") == []
+    assert [lines_of(chunk) for chunk in chunker.chunk("Empty.cs", "", "Nothing.")] == [(1, 1)]
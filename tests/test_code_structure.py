@@ -0,0 +1,117 @@
+from jarvis.index_project.code_structure import parse_csharp_symbols, parse_python_symbols
+
+CSHARP = """using System.Collections;
+
+namespace Game
+{
+    /// <summary>Moves the player.</summary>
+    public class Player : MonoBehaviour
+    {
+        [SerializeField] private float speed = 2f;
+
+        public int Health { get; set; }
+
+        public IEnumerator<int> Routine<T>(T value) where T : class
+        {
+            yield return 1;
+        }
+
+        public Dictionary<string, List<int>> Group<TKey, TValue>(TValue value)
+        {
+            return null;
+        }
+
+        int Count() => 3;
+    }
+
+    public record Point(int X, int Y);
+
+    public record struct Size(int Width, int Height);
+
+    public interface IDamageable
+    {
+        void TakeDamage(int amount);
+    }
+}
+"""
+
+PYTHON = '''import enum
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+class Player:
+    """Moves the player.
+
+    More details."""
+
+    @property
+    def health(self) -> int:
+        return 3
+
+    async def move(self, speed: float):
+        pass
+
+
+def main():
+    pass
+'''
+
+
+def summarize(symbols):
+    return [
+        (symbol.kind, symbol.name, symbol.start_line, symbol.end_line, summarize(symbol.children))
+        for symbol in symbols
+    ]
+
+
+def test_parse_csharp_symbols():
+    assert summarize(parse_csharp_symbols(CSHARP)) == [
+        (
+            "class",
+            "Player",
+            5,
+            23,
+            [
+                ("property", "Health", 10, 10, []),
+                ("method", "Routine", 12, 15, []),
+                ("method", "Group", 17, 20, []),
+                ("method", "Count", 22, 22, []),
+            ],
+        ),
+        ("record", "Point", 25, 25, []),
+        ("record", "Size", 27, 27, []),
+        ("interface", "IDamageable", 29, 32, [("method", "TakeDamage", 31, 31, [])]),
+    ]
+
+
+def test_parse_csharp_symbols_signature_and_doc():
+    player = parse_csharp_symbols(CSHARP)[0]
+    assert player.signature == "public class Player : MonoBehaviour"
+    assert player.doc == "Moves the player."
+    assert player.children[1].signature == (
+        "public IEnumerator<int> Routine<T>(T value) where T : class"
+    )
+
+
+def test_parse_python_symbols():
+    assert summarize(parse_python_symbols(PYTHON)) == [
+        ("enum", "Color", 4, 5, []),
+        (
+            "class",
+            "Player",
+            8,
+            18,
+            [("method", "health", 13, 15, []), ("method", "move", 17, 18, [])],
+        ),
+        ("function", "main", 21, 22, []),
+    ]
+    player = parse_python_symbols(PYTHON)[1]
+    assert player.doc == "Moves the player."
+    assert player.children[1].signature == "async def move(self, speed: float)"
+
+
+def test_parse_python_symbols_of_invalid_code():
+    assert parse_python_symbols("def broken(:\n") == []
@@ -0,0 +1,56 @@
+import pytest
+from jarvis.helper import db
+from jarvis.helper.db import Database, Role, Session
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A Database on a fresh SQLite schema"""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'jarvis.db'}")
+    monkeypatch.setattr(db, "_engine", None)
+    monkeypatch.setattr(db, "_session_factory", None)
+    yield Database()
+    db.get_engine().dispose()
+
+
+def test_record_exchange_creates_the_session_of_a_new_path(database: Database):
+    messages = database.record_exchange("Add a jump", "Done", path="C:\\Projects\\My Game")
+
+    session = database.find_session_by_path("C:/Projects/My Game/Assets")
+    assert session.id == messages[0].session_id == messages[1].session_id
+    assert session.path == "C:/Projects/My Game"
+    assert session.collection == "My_Game"
+    assert [(m.role, m.content) for m in database.get_messages(session.id)] == [
+        (Role.HUMAN, "Add a jump"),
+        (Role.AI, "Done"),
+    ]
+
+
+def test_record_exchange_uses_the_indexed_collection(database: Database):
+    database.create_project_collection("Assets", "/projects/game")
+
+    messages = database.record_exchange("Add a jump", "Done", path="/projects/game")
+
+    with database.SessionLocal() as db_session:
+        assert db_session.get(Session, messages[0].session_id).collection == "Assets"
+
+
+def test_history_pages_do_not_overlap(database: Database):
+    first_exchange = database.record_exchange("h1", "a1", path="/projects/game")
+    session_id = first_exchange[0].session_id
+    for turn in range(2, 5):
+        database.record_exchange(f"h{turn}", f"a{turn}", session_id=session_id)
+
+    with database.SessionLocal() as db_session:
+        first = db_session.scalars(db.select_recent_messages(session_id, 3)).all()
+        second = db_session.scalars(
+            db.select_recent_messages(session_id, 3, first[-1].id)
+        ).all()
+        assert [m.content for m in first] == ["a4", "h4", "a3"]
+        assert [m.content for m in second] == ["h3", "a2", "h2"]
+
+        # Before a window starting at a3, after a summary that ends at h1
+        between = db_session.scalars(
+            db.select_messages_between(session_id, first_exchange[0].id, first[-1].id, 10)
+        ).all()
+        assert [m.content for m in between] == ["a1", "h2", "a2", "h3"]
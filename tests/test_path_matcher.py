@@ -0,0 +1,34 @@
+from jarvis.index_project.path_matcher import PathMatcher
+
+
+def make_project(tmp_path):
+    for relative_path in [
+        "Assets/A.cs",
+        "Assets/Materials/B.cs",
+        "Assets/Materials/sub/C.cs",
+        "Assets/Scripts/D.cs",
+        "Assets/Scripts/Generated/E.cs",
+    ]:
+        file_path = tmp_path / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("class A {}")
+    (tmp_path / ".gitignore").write_text("Generated/\n")
+    return PathMatcher(str(tmp_path), str(tmp_path / "Assets"), ["Materials"], [".cs"])
+
+
+def test_iter_files_skips_ignored_directories(tmp_path):
+    matcher = make_project(tmp_path)
+    assert list(matcher.iter_files()) == [
+        str(tmp_path / "Assets" / "A.cs"),
+        str(tmp_path / "Assets" / "Scripts" / "D.cs"),
+    ]
+
+
+def test_iter_files_from_inside_an_ignored_directory(tmp_path):
+    """Starting the walk below an ignored directory yields nothing"""
+    matcher = make_project(tmp_path)
+    assert list(matcher.iter_files(str(tmp_path / "Assets" / "Materials" / "sub"))) == []
+    assert list(matcher.iter_files(str(tmp_path / "Assets" / "Scripts" / "Generated"))) == []
+    assert list(matcher.iter_files(str(tmp_path / "Assets" / "Scripts"))) == [
+        str(tmp_path / "Assets" / "Scripts" / "D.cs")
+    ]
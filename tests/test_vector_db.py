@@ -0,0 +1,35 @@
+from jarvis.helper.vector_db import VectorDB
+
+
+def make_vector_db(tmp_path, monkeypatch, max_batch_bytes: int) -> VectorDB:
+    monkeypatch.setenv("LOCAL_VECTOR_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setenv("LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+    monkeypatch.setenv("VECTOR_INSERT_BATCH_BYTES", str(max_batch_bytes))
+    return VectorDB("test_batches", dim=4, backend="local")
+
+
+def test_upsert_splits_batches_by_byte_size(tmp_path, monkeypatch):
+    vector_db = make_vector_db(tmp_path, monkeypatch, max_batch_bytes=1000)
+    batches = []
+    upsert = vector_db.backend.upsert
+
+    def record_upsert(ids, *row):
+        batches.append(list(ids))
+        return upsert(ids, *row)
+
+    monkeypatch.setattr(vector_db.backend, "upsert", record_upsert)
+
+    # Rows of 16 + 300 + 7 + 32 = 355 bytes, two fit in a batch,
+    # and a row over the limit still goes alone
+    texts = ["x" * 300] * 5 + ["y" * 2000] + ["x" * 300]
+    file_paths = [f"/p/{i}.cs" for i in range(len(texts))]
+    vectors = [[0.1, 0.2, 0.3, 0.4]] * len(texts)
+    ids = list(range(len(texts)))
+
+    assert vector_db.upsert(ids, texts, file_paths, vectors) == ids
+    assert batches == [[0, 1], [2, 3], [4], [5], [6]]
+    for batch in batches:
+        assert len(batch) == 1 or (
+            sum(vector_db.row_bytes(texts[i], file_paths[i]) for i in batch)
+            <= vector_db.max_batch_bytes
+        )